@@ -0,0 +1,168 @@
+"""JSON API over the venues, artists and shows, under /api/v1:
+
+    GET /api/v1/venues?fields=id,name,city&after=<cursor>
+    GET /api/v1/venues/1?embed=shows
+    GET /api/v1/artists, /api/v1/artists/<id>, /api/v1/shows
+    GET /api/v1/venues/near?lat=40.71&lon=-74.01&k=10
+
+`fields` selects the fields of each item, and only those columns are read from the database. `embed=shows` adds the
+past and upcoming shows of each venue or artist. Lists come a page at a time: `next_cursor`, when not null, is the
+`after` parameter of the next page. Every response has an ETag, and a request whose If-None-Match matches it gets an
+empty 304 response. Responses are encoded by orjson, from requirements.txt, or by the standard json module in the
+environments without it.
+"""
+import json
+from collections import defaultdict, namedtuple
+from datetime import datetime
+
+from flask import Blueprint, abort, request
+from sqlalchemy.orm import joinedload
+
+from flask_app import app
+from models import Artist, Genre, Show, Venue, artist_genres_table, current_time, db, venue_genres_table
+from pagination import keyset_paginate
+from queries import nearest_venues, with_page_loaders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+api = Blueprint('api', __name__)
+
+# A venue or artist resource, with its genres association table and the shows' foreign key to it.
+Resource = namedtuple('Resource', ['model', 'genres_table', 'genres_key', 'show_key', 'show_loader', 'serialize_show'])
+
+RESOURCES = {
+    'venues': Resource(Venue, venue_genres_table, 'venue_id', Show.venue_id, 'artist', Show.serialize),
+    'artists': Resource(Artist, artist_genres_table, 'artist_id', Show.artist_id, 'venue',
+                        Show.serialize_for_artist),
+}
+MAX_NEAREST = 100
+SHOW_FIELDS = ('id', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link', 'start_time')
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), default=datetime.isoformat).encode()
+
+
+def json_response(data, status=200):
+    """A JSON response that is answered with a 304 when the client already has it."""
+    response = app.response_class(dumps(data), status=status, mimetype='application/json')
+    if status == 200:
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
+
+def _error(status, message):
+    abort(json_response({'error': message}, status))
+
+
+def _requested_fields(available):
+    """The fields listed in the `fields` parameter, or all of `available` when it is missing."""
+    if 'fields' not in request.args:
+        return list(available)
+    fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        _error(400, f"Unknown fields {', '.join(unknown)}; available fields are {', '.join(available)}")
+    return fields
+
+
+def _embedded_shows(resource, ids):
+    """The past and upcoming shows of the venues or artists `ids`, by id, loaded with a single query."""
+    shows = {id: {'past_shows': [], 'upcoming_shows': []} for id in ids}
+    now = current_time()
+    for show in Show.query.options(joinedload(resource.show_loader)).filter(resource.show_key.in_(ids)) \
+            .order_by(Show.start_time):
+        if show.start_time > now:
+            shows[getattr(show, resource.show_key.key)]['upcoming_shows'].append(resource.serialize_show(show))
+        elif show.start_time < now:
+            shows[getattr(show, resource.show_key.key)]['past_shows'].append(resource.serialize_show(show))
+    for entity_shows in shows.values():
+        entity_shows['past_shows'].reverse()
+    return shows
+
+
+def _serialize(resource, rows, fields):
+    ids = [row.id for row in rows]
+    items = [{field: getattr(row, field) for field in fields if field != 'genres'} for row in rows]
+    if 'genres' in fields:
+        genres = defaultdict(list)
+        genres_table = resource.genres_table
+        entity_id = genres_table.c[resource.genres_key]
+        for id, name in db.session.query(entity_id, Genre.name).join(Genre, Genre.id == genres_table.c.genre_id) \
+                .filter(entity_id.in_(ids)):
+            genres[id].append(name)
+        for id, item in zip(ids, items):
+            item['genres'] = genres[id]
+    if request.args.get('embed') == 'shows':
+        shows = _embedded_shows(resource, ids)
+        for id, item in zip(ids, items):
+            item.update(shows[id])
+    return items
+
+
+def _query(resource, fields):
+    columns = resource.model.__table__.columns
+    return db.session.query(*[columns[field] for field in dict.fromkeys(['id', *fields]) if field != 'genres'])
+
+
+def _available_fields(resource):
+    return [*resource.model.__table__.columns.keys(), 'genres']
+
+
+@api.route('/<any(venues, artists):name>')
+def list_resources(name):
+    resource = RESOURCES[name]
+    fields = _requested_fields(_available_fields(resource))
+    rows, next_cursor = keyset_paginate(_query(resource, fields), (resource.model.id,), request.args.get('after'))
+    return json_response({'data': _serialize(resource, rows, fields), 'next_cursor': next_cursor})
+
+
+@api.route('/<any(venues, artists):name>/<int:id>')
+def get_resource(name, id):
+    resource = RESOURCES[name]
+    fields = _requested_fields(_available_fields(resource))
+    row = _query(resource, fields).filter(resource.model.id == id).first()
+    if row is None:
+        _error(404, f'No {name[:-1]} with id {id}')
+    return json_response(_serialize(resource, [row], fields)[0])
+
+
+@api.route('/venues/near')
+def list_nearest_venues():
+    """The `k` venues nearest to the point at `lat`, `lon`, with their distance in km and upcoming show counts."""
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lon', type=float)
+    k = request.args.get('k', 10, type=int)
+    if latitude is None or longitude is None or not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        _error(400, 'lat and lon must be a latitude between -90 and 90 and a longitude between -180 and 180')
+    if not 1 <= k <= MAX_NEAREST:
+        _error(400, f'k must be between 1 and {MAX_NEAREST}')
+    data = [{
+        'id': venue.id,
+        'name': venue.name,
+        'city': venue.city,
+        'state': venue.state,
+        'latitude': venue.latitude,
+        'longitude': venue.longitude,
+        'distance_km': round(distance, 3),
+        'upcoming_shows_count': venue.upcoming_shows_count,
+    } for venue, distance in nearest_venues(latitude, longitude, k)]
+    return json_response({'data': data})
+
+
+@api.route('/shows')
+def list_shows():
+    fields = _requested_fields(SHOW_FIELDS)
+    shows, next_cursor = keyset_paginate(with_page_loaders(Show.query, 'shows'), (Show.start_time, Show.id),
+                                         request.args.get('after'))
+    data = [{field: getattr(show, field) for field in fields} for show in shows]
+    return json_response({'data': data, 'next_cursor': next_cursor})
+
+
+app.register_blueprint(api, url_prefix='/api/v1')
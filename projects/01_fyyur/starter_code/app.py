@@ -1,31 +1,73 @@
 import logging
+from datetime import datetime
+from functools import lru_cache
 
 import babel
-from babel.dates import get_timezone
+from babel.dates import UTC, get_timezone, parse_pattern
 import dateutil.parser
-from flask import render_template, request, flash, redirect, url_for
+from flask import abort, g, render_template, request, flash, redirect, url_for
 
+import api  # noqa: F401 (registers the JSON API)
+import bulk  # noqa: F401 (registers the import and export commands)
+from cache import artist_key, page_cache, revision_key, venue_key
+from conditional import conditional_page
+import counters  # noqa: F401 (maintains the show counters and registers the rollover command)
 from flask_app import app
 from forms import VenueForm, ArtistForm, ShowForm
-from models import Venue, Artist, Genre, Show, db
+from genres import genre_lookup
+import instrumentation  # noqa: F401 (reports the SQL statements of each request)
+from jobs import job_queue
+from models import Venue, Artist, Show, db
+from pagination import keyset_paginate
+from queries import (artist_revision, shows_revision, stream_shows, stream_venue_directory, venue_directory,
+                     venue_directory_revision, venue_revision, with_page_loaders)
+from search import find_artists, find_venues
+import seeding  # noqa: F401 (registers the seed command)
+from streaming import stream_template
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
 
+DISPLAY_TIMEZONE = get_timezone('US/Eastern')
+DISPLAY_LOCALE = babel.Locale.parse('en_US')
+DATETIME_PATTERNS = {
+    'full': parse_pattern("EEEE MMMM, d, y 'at' h:mma"),
+    'medium': parse_pattern("EE MM, dd, y h:mma"),
+}
+# Named formats of Babel, whose patterns depend on the locale.
+BABEL_FORMATS = {'short', 'long'}
+
+
+@lru_cache(maxsize=4096)
+def _format_datetime(date, frmat):
+    # Same conversion as babel.dates.format_datetime: naive datetimes are UTC.
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=UTC)
+    if frmat in BABEL_FORMATS:
+        return babel.dates.format_datetime(date, frmat, tzinfo=DISPLAY_TIMEZONE, locale=DISPLAY_LOCALE)
+    date = DISPLAY_TIMEZONE.normalize(date.astimezone(DISPLAY_TIMEZONE))
+    pattern = DATETIME_PATTERNS.get(frmat) or parse_pattern(frmat)
+    return pattern.apply(date, DISPLAY_LOCALE)
+
+
 def format_datetime(value, frmat='medium'):
-    date = dateutil.parser.parse(value)
-    if frmat == 'full':
-        frmat = "EEEE MMMM, d, y 'at' h:mma"
-    elif frmat == 'medium':
-        frmat = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, frmat, tzinfo=get_timezone('US/Eastern'), locale='en_US')
+    """Formats a datetime, or a string holding one, for display. Formatted values are memoized."""
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    return _format_datetime(value, frmat)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
 
+def _cached_page_data(key, compute):
+    """page_cache.get_or_set, caching only what was read from the primary database: a replica that has not caught up
+    would put back the data a write just invalidated, and serve it to the writer too."""
+    return page_cache.get_or_set(key, compute, store=not g.get('read_from_replica'))
+
+
 @app.route('/')
 def index():
     return render_template('pages/home.html')
@@ -36,43 +78,38 @@ def index():
 
 @app.route('/venues')
 def venues():
-    all_cities = set([(city, state) for city, state in [(venue.city, venue.state)
-                                                        for venue in Venue.query.all()]])
-    data = []
-    for city, state in all_cities:
-        venues_in_city_state = Venue.query.filter_by(state=state).filter_by(city=city).all()
-        data.append({
-            "city": city,
-            "state": state,
-            "venues": [{
-                "id": venue.id,
-                "name": venue.name,
-                "num_upcoming_shows": venue.upcoming_shows_count
-            } for venue in venues_in_city_state]
-        })
-    return render_template('pages/venues.html', areas=data)
+    if 'stream' in request.args:
+        return stream_template('pages/venues.html', areas=stream_venue_directory())
+    cursor = request.args.get('after')
+
+    def render():
+        areas, next_cursor = venue_directory(cursor)
+        return render_template('pages/venues.html', areas=areas, next_cursor=next_cursor)
+
+    return conditional_page(venue_directory_revision(cursor), render, last_modified=False)
 
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
     search_term = request.form.get('search_term', '')
-    found_venues = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
-    response = {
-        "count": len(found_venues),
-        "data": [{
-            "id": venue.id,
-            "name": venue.name,
-            "num_upcoming_shows": venue.upcoming_shows_count,
-        } for venue in found_venues]
-    }
-    return render_template('pages/search_venues.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+    response = find_venues(search_term, page=request.form.get('page', 1, type=int))
+    return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
-    venue = Venue.query.filter_by(id=venue_id).first()
-    return render_template('pages/show_venue.html', venue=venue.serialize())
+    def serialize_venue():
+        venue = with_page_loaders(Venue.query, 'show_venue').filter_by(id=venue_id).first()
+        return venue.serialize() if venue else None
+
+    def render():
+        venue = _cached_page_data(venue_key(venue_id), serialize_venue)
+        if venue is None:
+            abort(404)
+        return render_template('pages/show_venue.html', venue=venue)
+
+    revision = _cached_page_data(revision_key(venue_key(venue_id)), lambda: venue_revision(venue_id))
+    return conditional_page(revision, render)
 
 
 #  Create Venue
@@ -103,8 +140,11 @@ def create_venue_submission():
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
     try:
+        artist_ids = [artist_id for artist_id, in db.session.query(Show.artist_id).filter_by(venue_id=venue_id)]
         Venue.query.filter_by(id=venue_id).delete()
         db.session.commit()
+        page_cache.delete(venue_key(venue_id))
+        job_queue.enqueue_or_run('invalidate_cached_pages', [artist_key(artist_id) for artist_id in artist_ids])
         flash('Venue ' + request.form['name'] + ' was successfully deleted!')
     except Exception as e:
         flash('An error occurred. The venue could not be deleted.')
@@ -122,34 +162,37 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
+    rows, next_cursor = keyset_paginate(db.session.query(Artist.id, Artist.name), (Artist.id,),
+                                        request.args.get('after'))
     data = [{
-        "id": artist.id,
-        "name": artist.name
-    } for artist in Artist.query.all()]
-    return render_template('pages/artists.html', artists=data)
+        "id": id,
+        "name": name
+    } for id, name in rows]
+    return render_template('pages/artists.html', artists=data, next_cursor=next_cursor)
 
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
     search_term = request.form.get('search_term', '')
-    found_artists = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
-    response = {
-        "count": len(found_artists),
-        "data": [{
-            "id": artist.id,
-            "name": artist.name,
-            "num_upcoming_shows": artist.upcoming_shows_count,
-        } for artist in found_artists]
-    }
-    return render_template('pages/search_artists.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+    response = find_artists(search_term, page=request.form.get('page', 1, type=int))
+    return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
-    artist = Artist.query.filter_by(id=artist_id).first()
-    return render_template('pages/show_artist.html', artist=artist.serialize())
+    def serialize_artist():
+        artist = with_page_loaders(Artist.query, 'show_artist').filter_by(id=artist_id).first()
+        return artist.serialize() if artist else None
+
+    def render():
+        artist = _cached_page_data(artist_key(artist_id), serialize_artist)
+        if artist is None:
+            abort(404)
+        return render_template('pages/show_artist.html', artist=artist)
+
+    revision = _cached_page_data(revision_key(artist_key(artist_id)), lambda: artist_revision(artist_id))
+    return conditional_page(revision, render)
 
 
 #  Update
@@ -168,6 +211,46 @@ def edit_venue(venue_id):
     return render_template('forms/edit_venue.html', form=form, venue=venue.serialize())
 
 
+def _cached_pages_showing(db_item):
+    """Cache keys of the pages displaying `db_item`: its own page and the pages listing it among their shows."""
+    if isinstance(db_item, Show):
+        return [venue_key(db_item.venue_id), artist_key(db_item.artist_id)]
+    if isinstance(db_item, Venue):
+        artist_ids = db.session.query(Show.artist_id).filter_by(venue_id=db_item.id).distinct()
+        return [venue_key(db_item.id)] + [artist_key(artist_id) for artist_id, in artist_ids]
+    venue_ids = db.session.query(Show.venue_id).filter_by(artist_id=db_item.id).distinct()
+    return [artist_key(db_item.id)] + [venue_key(venue_id) for venue_id, in venue_ids]
+
+
+# A memory cache belongs to the process that wrote: another process running these jobs would clear its own instead.
+CACHE_JOBS_ARE_LOCAL = app.config['CACHE_BACKEND'] == 'memory'
+
+
+@job_queue.task(local=CACHE_JOBS_ARE_LOCAL)
+def invalidate_cached_pages(keys):
+    page_cache.delete(*keys)
+
+
+@job_queue.task(local=CACHE_JOBS_ARE_LOCAL)
+def invalidate_pages_showing(entity, id):
+    db_item = {'venue': Venue, 'artist': Artist}[entity].query.get(id)
+    if db_item is not None:
+        page_cache.delete(*_cached_pages_showing(db_item))
+
+
+def _invalidate_cached_pages(db_item):
+    """Drops the cached page of `db_item` right away, so that the redirect after an edit shows the change, and leaves
+    the pages listing it among their shows, which take a query to find, to a background job."""
+    if isinstance(db_item, Show):
+        page_cache.delete(*_cached_pages_showing(db_item))
+    elif isinstance(db_item, Venue):
+        page_cache.delete(venue_key(db_item.id))
+        job_queue.enqueue_or_run('invalidate_pages_showing', 'venue', db_item.id)
+    else:
+        page_cache.delete(artist_key(db_item.id))
+        job_queue.enqueue_or_run('invalidate_pages_showing', 'artist', db_item.id)
+
+
 def _edit_or_create_db_item(db_item, form):
     """Used to create a new artist, venue, or show."""
     try:
@@ -175,10 +258,10 @@ def _edit_or_create_db_item(db_item, form):
             if key.lower() != 'genres':
                 setattr(db_item, key, value)
             else:
-                genre = Genre.query.filter_by(name=value).first()
-                db_item.genres = [genre]
+                db_item.genres = genre_lookup.resolve(form.getlist(key))
         db.session.add(db_item)
         db.session.commit()
+        _invalidate_cached_pages(db_item)
     except Exception as e:
         flash('An error occurred.')
         print(e)
@@ -224,9 +307,17 @@ def create_artist_submission():
 @app.route('/shows')
 def shows():
     # displays all shows
-    all_shows = Show.query.all()
-    data = [show.serialize_for_all_upcoming_shows_page() for show in all_shows]
-    return render_template('pages/shows.html', shows=data)
+    if 'stream' in request.args:
+        return stream_template('pages/shows.html', shows=stream_shows())
+    cursor = request.args.get('after')
+
+    def render():
+        page_shows, next_cursor = keyset_paginate(with_page_loaders(Show.query, 'shows'), (Show.start_time, Show.id),
+                                                  cursor)
+        data = [show.serialize_for_all_upcoming_shows_page() for show in page_shows]
+        return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
+
+    return conditional_page(shows_revision(cursor), render, last_modified=False)
 
 
 @app.route('/shows/create')
@@ -0,0 +1,234 @@
+"""Benchmarks for Fyyur's pages.
+
+Runs against an in-memory SQLite database unless BENCHMARK_DATABASE_URI is set:
+
+    python benchmark.py
+"""
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from flask_app import app
+
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('BENCHMARK_DATABASE_URI', 'sqlite://')
+
+from cache import page_cache  # noqa: E402
+from counters import refresh_show_counters  # noqa: E402
+from genres import genre_lookup  # noqa: E402
+from models import Artist, Show, Venue, db  # noqa: E402 (the database URI must be set before the engine is created)
+
+
+@contextmanager
+def count_queries():
+    """Counts the SQL statements executed inside the block. The count is available as `counter[0]`."""
+    counter = [0]
+
+    def before_cursor_execute(*args):
+        counter[0] += 1
+
+    engine = db.get_engine()
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@contextmanager
+def record_queries():
+    """Records the SQL statements executed inside the block, as (statement, parameters) pairs."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = db.get_engine()
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def _recreate_tables():
+    db.drop_all()
+    if db.engine.dialect.name == 'postgresql':
+        db.engine.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    db.create_all()
+
+
+def seed(num_venues, shows_per_venue=2, num_cities=50):
+    """Replaces the database contents with `num_venues` venues, one artist per venue and a mix of past and
+    upcoming shows."""
+    _recreate_tables()
+    now = datetime.now()
+    db.session.bulk_insert_mappings(Venue, [{
+        'id': i,
+        'name': f'Venue {i}',
+        'city': f'City {i % num_cities}',
+        'state': 'NY' if i % 2 else 'CA',
+    } for i in range(1, num_venues + 1)])
+    db.session.bulk_insert_mappings(Artist, [{
+        'id': i,
+        'name': f'Artist {i}',
+    } for i in range(1, num_venues + 1)])
+    db.session.bulk_insert_mappings(Show, [{
+        'venue_id': i,
+        'artist_id': i,
+        'start_time': now + timedelta(days=30 if j % 2 else -30),
+    } for i in range(1, num_venues + 1) for j in range(shows_per_venue)])
+    refresh_show_counters(db.session.connection())
+    db.session.commit()
+    page_cache.clear()
+    genre_lookup.invalidate()
+
+
+def benchmark_venues(scales=(10, 100, 1000, 10000)):
+    """The number of queries issued by /venues must not grow with the number of venues."""
+    client = app.test_client()
+    print('/venues')
+    for num_venues in scales:
+        seed(num_venues)
+        start = time.perf_counter()
+        with count_queries() as counter:
+            response = client.get('/venues')
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200
+        print(f'  {num_venues:>7} venues: {counter[0]:>3} queries, {elapsed * 1000:8.1f} ms')
+
+
+def _ilike_search_venues(search_term):
+    """The venue search as it was before the search module: unbounded ILIKE and one count per result."""
+    found_venues = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
+    return {
+        "count": len(found_venues),
+        "data": [{
+            "id": venue.id,
+            "name": venue.name,
+            "num_upcoming_shows": len(venue.upcoming_shows),
+        } for venue in found_venues]
+    }
+
+
+def benchmark_search(num_venues=100000, search_terms=('Venue 4242', 'Venue 99', 'City 7'), repeat=3):
+    """Compares the latency of the ILIKE search with the ranked, paginated search."""
+    from search import find_venues
+
+    seed(num_venues)
+    print(f'venue search over {num_venues} venues')
+    for search_term in search_terms:
+        for label, search in (('ilike', _ilike_search_venues), ('search', find_venues)):
+            with app.app_context():
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    count = search(search_term)['count']
+                elapsed = (time.perf_counter() - start) / repeat
+            print(f'  {search_term!r:>14} {label:>6}: {count:>6} matches, {elapsed * 1000:8.1f} ms')
+
+
+def benchmark_streaming(scales=(1000, 10000, 50000)):
+    """Time to first byte of the streamed /shows and /venues pages should not grow with the number of rows."""
+    client = app.test_client()
+    print('time to first byte / total, streamed')
+    for num_venues in scales:
+        seed(num_venues)
+        for url in ('/shows?stream', '/venues?stream'):
+            start = time.perf_counter()
+            response = client.get(url, buffered=False)
+            chunks = iter(response.response)
+            next(chunks)
+            first_byte = time.perf_counter() - start
+            for _ in chunks:
+                pass
+            total = time.perf_counter() - start
+            response.close()
+            print(f'  {url:>15} {num_venues:>6} venues: {first_byte * 1000:8.1f} ms / {total * 1000:8.1f} ms')
+
+
+def _dateutil_babel_format_datetime(value, frmat='medium'):
+    """The datetime filter as it was before it was cached: parses strings and resolves everything per call."""
+    import babel.dates
+    import dateutil.parser
+
+    date = dateutil.parser.parse(value)
+    if frmat == 'full':
+        frmat = "EEEE MMMM, d, y 'at' h:mma"
+    elif frmat == 'medium':
+        frmat = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, frmat, tzinfo=babel.dates.get_timezone('US/Eastern'), locale='en_US')
+
+
+def benchmark_datetime_filter(num_rows=100000, num_distinct=1000):
+    """Formats `num_rows` show start times, of which `num_distinct` are distinct, as the /shows page would."""
+    from app import _format_datetime, format_datetime
+
+    start = datetime(2020, 1, 1, 20)
+    dates = [start + timedelta(days=i % num_distinct) for i in range(num_rows)]
+    strings = [date.strftime('%Y-%m-%d %H:%M:%S') for date in dates]
+    print(f'datetime filter over {num_rows} rows ({num_distinct} distinct)')
+    _format_datetime.cache_clear()
+    for label, formatter, values in (('strings, uncached', _dateutil_babel_format_datetime, strings),
+                                     ('datetimes, cached', format_datetime, dates)):
+        begin = time.perf_counter()
+        for value in values:
+            formatter(value, 'full')
+        elapsed = time.perf_counter() - begin
+        print(f'  {label:>18}: {elapsed * 1000:8.1f} ms')
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def benchmark_load(scales=(10000, 100000, 1000000), num_requests=200, random_seed=0):
+    """Drives the main pages over databases of generated data, reporting the p50 and p99 latencies and the SQL
+    statements per request at each scale. The page cache is cleared before each request, so every request hits the
+    database."""
+    import random
+
+    from seeding import CITIES, NOUNS, seed_database
+
+    client = app.test_client()
+    rng = random.Random(random_seed)
+    print(f'load, {num_requests} requests per page')
+    for num_shows in scales:
+        start = time.perf_counter()
+        _recreate_tables()
+        num_venues, num_artists = seed_database(num_shows, random_seed)
+        print(f'  {num_shows} shows, {num_venues} venues, {num_artists} artists '
+              f'(seeded in {time.perf_counter() - start:.1f} s)')
+        pages = [
+            ('/venues', lambda: client.get('/venues')),
+            ('/shows', lambda: client.get('/shows')),
+            ('/artists/<id>', lambda: client.get(f'/artists/{rng.randint(1, num_artists)}')),
+            ('/venues/search', lambda: client.post('/venues/search', data={'search_term': rng.choice(NOUNS)})),
+            ('/artists/search', lambda: client.post('/artists/search',
+                                                    data={'search_term': rng.choice(CITIES)[0]})),
+        ]
+        for label, request in pages:
+            latencies = []
+            statements = 0
+            for _ in range(num_requests):
+                page_cache.clear()
+                with count_queries() as counter:
+                    begin = time.perf_counter()
+                    response = request()
+                    latencies.append(time.perf_counter() - begin)
+                assert response.status_code == 200, (label, response.status_code)
+                statements += counter[0]
+            print(f'    {label:>16}: p50 {_percentile(latencies, 0.5) * 1000:8.1f} ms, '
+                  f'p99 {_percentile(latencies, 0.99) * 1000:8.1f} ms, {statements / num_requests:5.1f} statements')
+
+
+if __name__ == '__main__':
+    import app as fyyur  # noqa: F401 (registers the routes)
+
+    benchmark_venues()
+    benchmark_search()
+    benchmark_streaming()
+    benchmark_datetime_filter()
+    benchmark_load()
@@ -0,0 +1,256 @@
+"""Bulk import and export of venues, artists and shows, as CSV or JSONL files:
+
+    flask import venues venues.csv
+    flask export shows shows.jsonl
+
+Genres are a list in JSONL files and a ';' separated string in CSV files. Rows without an id take the next values of
+the id sequence of their table on Postgres, reserved a chunk at a time so that rows the app adds meanwhile do not get
+the same ids, and are numbered after the largest id in the table when the import starts elsewhere. Lines that are not
+valid records are skipped and counted.
+"""
+import csv
+import io
+import json
+import time
+from collections import defaultdict
+from datetime import datetime
+from itertools import count, islice
+
+import click
+import dateutil.parser
+from sqlalchemy import Boolean, DateTime, Float, Integer, func
+
+from counters import refresh_show_counters
+from flask_app import app
+from genres import genre_lookup
+from models import Artist, Genre, Show, Venue, artist_genres_table, db, geohash_of, venue_genres_table
+
+CHUNK_SIZE = 5000
+MAX_CHUNK_SIZE = 100000
+TRUE_VALUES = {'1', 't', 'true', 'y', 'yes'}
+
+# The model of each entity, with its genres association table and the column of that table referencing it.
+ENTITIES = {
+    'venues': (Venue, venue_genres_table, 'venue_id'),
+    'artists': (Artist, artist_genres_table, 'artist_id'),
+    'shows': (Show, None, None),
+}
+
+
+def read_records(path):
+    """Yields the records of a CSV or JSONL file one at a time, as dicts, and None for the lines that are not one."""
+    with open(path, newline='') as file:
+        if path.endswith('.jsonl'):
+            for line in file:
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        record = None
+                    yield record if isinstance(record, dict) else None
+        else:
+            yield from csv.DictReader(file)
+
+
+def _convert(column, value):
+    if value is None or value == '':
+        return None
+    if isinstance(column.type, Integer):
+        return int(value)
+    if isinstance(column.type, Float):
+        return float(value)
+    if isinstance(column.type, Boolean) and isinstance(value, str):
+        return value.strip().lower() in TRUE_VALUES
+    if isinstance(column.type, DateTime) and isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return dateutil.parser.parse(value)
+    return value
+
+
+def _to_row(table, record):
+    """Converts a record to a row of `table`. Raises ValueError if the record is invalid."""
+    row = {column.name: _convert(column, record.get(column.name)) for column in table.columns}
+    for column in table.columns:
+        if row[column.name] is None and column.default is not None:
+            row[column.name] = column.default.arg(None) if column.default.is_callable else column.default.arg
+        if row[column.name] is None and not column.nullable and not column.primary_key:
+            raise ValueError(f'{column.name} is required')
+    return row
+
+
+def _genre_names(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(';')
+    return [name.strip() for name in value if name.strip()]
+
+
+def insert_rows(table, rows):
+    """Inserts `rows` with COPY on Postgres and a single executemany elsewhere."""
+    if not rows:
+        return
+    if db.engine.dialect.name != 'postgresql':
+        db.session.execute(table.insert(), rows)
+        return
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([row[column] for column in columns] for row in rows)
+    buffer.seek(0)
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(f'COPY "{table.name}" ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def _genre_ids(names):
+    """Ids of the genres named `names`, by name. Genres that do not exist yet are created."""
+    ids_by_name = genre_lookup.ids(names)
+    missing = sorted(set(names) - set(ids_by_name))
+    if missing:
+        db.session.execute(Genre.__table__.insert(), [{'name': name} for name in missing])
+        genre_lookup.invalidate()
+        ids_by_name = genre_lookup.ids(names)
+    return ids_by_name
+
+
+def _keep_existing_references(rows):
+    """Drops the shows whose venue or artist does not exist, with one query per referenced table."""
+    venue_ids = {row['venue_id'] for row in rows}
+    artist_ids = {row['artist_id'] for row in rows}
+    venue_ids = {venue_id for venue_id, in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+    artist_ids = {artist_id for artist_id, in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+    return [row for row in rows if row['venue_id'] in venue_ids and row['artist_id'] in artist_ids]
+
+
+def import_chunk(entity, records, next_id):
+    """Inserts a chunk of records in one transaction. Returns the number of rows imported and skipped."""
+    model, genres_table, genres_key = ENTITIES[entity]
+    table = model.__table__
+    rows = []
+    genres = []
+    for record in records:
+        if record is None:
+            continue
+        try:
+            row = _to_row(table, record)
+        except (TypeError, ValueError, OverflowError):
+            continue
+        if row['id'] is None:
+            row['id'] = next(next_id)
+        rows.append(row)
+        genres.append(_genre_names(record.get('genres')))
+    skipped = len(records) - len(rows)
+    if model is Venue:
+        for row in rows:
+            row['geohash'] = geohash_of(row['latitude'], row['longitude'])
+    if model is Show:
+        imported = _keep_existing_references(rows)
+        skipped += len(rows) - len(imported)
+        rows = imported
+    insert_rows(table, rows)
+    if model is Show:
+        refresh_show_counters(db.session.connection(), {row['venue_id'] for row in rows},
+                              {row['artist_id'] for row in rows})
+    if genres_table is not None:
+        genre_ids = _genre_ids({name for names in genres for name in names})
+        insert_rows(genres_table, [{'genre_id': genre_ids[name], genres_key: row['id']}
+                                   for row, names in zip(rows, genres) for name in dict.fromkeys(names)])
+    db.session.commit()
+    return len(rows), skipped
+
+
+def reserve_ids(table, number):
+    """Takes `number` values from the id sequence of `table` on Postgres, for rows inserted with explicit ids."""
+    result = db.session.execute(f"""SELECT nextval(pg_get_serial_sequence('"{table.name}"', 'id'))
+                                    FROM generate_series(1, :number)""", {'number': number})
+    return [id for id, in result]
+
+
+def reset_id_sequence(table):
+    """Makes the id sequence of `table` continue after its largest id, once rows were inserted with explicit ids."""
+    if db.engine.dialect.name == 'postgresql':
+        # Never moves the sequence back, below the ids reserved by reserve_ids or taken by the app meanwhile.
+        db.session.execute(f"""SELECT setval(pg_get_serial_sequence('"{table.name}"', 'id'),
+                                             greatest((SELECT coalesce(max(id), 1) FROM "{table.name}"),
+                                                      nextval(pg_get_serial_sequence('"{table.name}"', 'id'))))""")
+        db.session.commit()
+
+
+def export_records(entity, chunk_size=CHUNK_SIZE):
+    """Yields every venue, artist or show as a dict, reading `chunk_size` rows and their genres at a time."""
+    model, genres_table, genres_key = ENTITIES[entity]
+    columns = model.__table__.columns
+    last_id = 0
+    while True:
+        rows = db.session.query(*columns).filter(model.id > last_id).order_by(model.id).limit(chunk_size).all()
+        if not rows:
+            return
+        genres = defaultdict(list)
+        if genres_table is not None:
+            entity_id = genres_table.c[genres_key]
+            for id, name in db.session.query(entity_id, Genre.name) \
+                    .join(Genre, Genre.id == genres_table.c.genre_id) \
+                    .filter(entity_id.in_([row.id for row in rows])):
+                genres[id].append(name)
+        for row in rows:
+            record = dict(zip(columns.keys(), row))
+            if genres_table is not None:
+                record['genres'] = genres[row.id]
+            yield record
+        last_id = rows[-1].id
+
+
+def _report(rows, skipped, start):
+    elapsed = time.perf_counter() - start
+    click.echo(f'{rows} rows, {skipped} skipped, {elapsed:.1f} s, {rows / max(elapsed, 1e-9):.0f} rows/s')
+
+
+@app.cli.command('import')
+@click.argument('entity', type=click.Choice(ENTITIES))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=CHUNK_SIZE, type=click.IntRange(1, MAX_CHUNK_SIZE), show_default=True,
+              help='Rows inserted per transaction.')
+def import_command(entity, path, chunk_size):
+    """Imports venues, artists or shows from a CSV or JSONL file."""
+    model = ENTITIES[entity][0]
+    next_id = count((db.session.query(func.max(model.id)).scalar() or 0) + 1)
+    records = read_records(path)
+    imported = skipped = 0
+    start = time.perf_counter()
+    for chunk in iter(lambda: list(islice(records, chunk_size)), []):
+        if db.engine.dialect.name == 'postgresql':
+            next_id = iter(reserve_ids(model.__table__, len(chunk)))
+        chunk_imported, chunk_skipped = import_chunk(entity, chunk, next_id)
+        imported += chunk_imported
+        skipped += chunk_skipped
+        _report(imported, skipped, start)
+    reset_id_sequence(model.__table__)
+
+
+@app.cli.command('export')
+@click.argument('entity', type=click.Choice(ENTITIES))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--chunk-size', default=CHUNK_SIZE, type=click.IntRange(1, MAX_CHUNK_SIZE), show_default=True,
+              help='Rows read per query.')
+def export_command(entity, path, chunk_size):
+    """Exports venues, artists or shows to a CSV or JSONL file."""
+    start = time.perf_counter()
+    exported = 0
+    with open(path, 'w', newline='') as file:
+        if path.endswith('.jsonl'):
+            for record in export_records(entity, chunk_size):
+                file.write(json.dumps(record, default=datetime.isoformat) + '\n')
+                exported += 1
+        else:
+            writer = None
+            for record in export_records(entity, chunk_size):
+                if 'genres' in record:
+                    record['genres'] = ';'.join(record['genres'])
+                if writer is None:
+                    writer = csv.DictWriter(file, fieldnames=list(record))
+                    writer.writeheader()
+                writer.writerow(record)
+                exported += 1
+    _report(exported, 0, start)
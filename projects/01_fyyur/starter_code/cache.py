@@ -0,0 +1,148 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask_app import app
+
+
+class LRUCache:
+    """In-process cache holding at most `max_entries` values, each for at most `timeout` seconds."""
+
+    def __init__(self, max_entries=1024, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileCache:
+    """Cache keeping each value in its own file under `directory`, shared by every process on the machine.
+
+    It has the same get/set/delete interface as the other backends, so it can stand in for a shared cache server.
+    """
+
+    def __init__(self, directory, timeout=300):
+        self.directory = directory
+        self.timeout = timeout
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as file:
+                expires_at, value = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires_at < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value):
+        # Write to a temporary file first so that readers never see a partially written value.
+        fd, temporary_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump((time.time() + self.timeout, value), file)
+        os.replace(temporary_path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+
+class PageCache:
+    """Caches the data of pages in `backend`, counting hits and misses."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_set(self, key, compute, store=True):
+        """Returns the value cached under `key`, or computes, caches and returns it. None is never cached, and
+        neither is anything when `store` is false."""
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = compute()
+        if value is not None and store:
+            self.backend.set(key, value)
+        return value
+
+    def delete(self, *keys):
+        """Drops the values cached under `keys`, along with their revisions."""
+        for key in keys:
+            self.backend.delete(key)
+            self.backend.delete(revision_key(key))
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def revision_key(key):
+    """Key of the revision of the page cached under `key`, which validates conditional requests for it."""
+    return f'{key}:revision'
+
+
+def venue_key(venue_id):
+    return f'venue:{venue_id}'
+
+
+def artist_key(artist_id):
+    return f'artist:{artist_id}'
+
+
+def create_page_cache(config):
+    timeout = config['CACHE_DEFAULT_TIMEOUT']
+    if config['CACHE_BACKEND'] == 'file':
+        return PageCache(FileCache(config['CACHE_DIR'], timeout=timeout))
+    if config['CACHE_BACKEND'] == 'memory':
+        return PageCache(LRUCache(config['CACHE_MAX_ENTRIES'], timeout=timeout))
+    raise ValueError(f"Unknown CACHE_BACKEND {config['CACHE_BACKEND']!r}, expected 'memory' or 'file'")
+
+
+page_cache = create_page_cache(app.config)
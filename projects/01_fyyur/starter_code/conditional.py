@@ -0,0 +1,49 @@
+import hashlib
+from datetime import datetime
+
+from flask import make_response, request, session
+
+from flask_app import app
+
+# Bump when the templates change in a way that should invalidate the pages browsers and CDNs hold.
+PAGES_VERSION = 1
+
+
+def conditional_page(revision, render, last_modified=True):
+    """Answers a GET with an empty 304 when the client already has the current version of the page, and with
+    `render()` otherwise.
+
+    `revision` is a tuple of values that changes whenever the page would, such as the update times of the rows it
+    displays; the ETag is a hash of it and Last-Modified its latest datetime. Pages are marked no-cache, so browsers
+    revalidate them on each visit instead of showing a copy they guessed to still be fresh.
+
+    Pass `last_modified=False` for pages that can change without their latest update time moving forward, such as
+    lists losing a deleted row: they are then validated by their ETag only, and If-Modified-Since is ignored.
+    """
+    if revision is None or session.get('_flashes'):
+        # No validator, or a message the cached copy does not show.
+        return make_response(render())
+    etag = hashlib.sha1(repr((PAGES_VERSION, request.full_path, revision)).encode()).hexdigest()
+    if last_modified:
+        last_modified = max((value for value in revision if isinstance(value, datetime)), default=None)
+    else:
+        last_modified = None
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0)
+    if _is_fresh(etag, last_modified):
+        response = app.response_class(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    if last_modified is not None:
+        # Werkzeug sends the current time for a Last-Modified of None.
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def _is_fresh(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if_modified_since = request.if_modified_since
+    return bool(last_modified and if_modified_since and last_modified <= if_modified_since.replace(tzinfo=None))
@@ -6,5 +6,49 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 # Enable debug mode.
 DEBUG = True
 
+
+def _environ_flag(name, default):
+    return os.environ.get(name, str(default)).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
 # Connect to the database
-SQLALCHEMY_DATABASE_URI = 'postgres://jordan@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgres://jordan@localhost:5432/fyyur')
+
+# Postgres connection pool of each worker process. A worker holds up to DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW
+# connections: keep that, times the number of workers, under the server's max_connections. Connections are tested
+# before use (pre-ping) and replaced after DATABASE_POOL_RECYCLE seconds, so they do not go stale after a failover.
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT', 30))
+DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800))
+DATABASE_POOL_PRE_PING = _environ_flag('DATABASE_POOL_PRE_PING', True)
+# Statements running longer than this are cancelled by the server. 0 disables the timeout.
+DATABASE_STATEMENT_TIMEOUT_MS = int(os.environ.get('DATABASE_STATEMENT_TIMEOUT_MS', 0))
+# Set when connecting through PgBouncer in transaction pooling mode: PgBouncer then pools the connections, and
+# session state (startup options, SET, server-side prepared statements) is not relied on.
+DATABASE_PGBOUNCER = _environ_flag('DATABASE_PGBOUNCER', False)
+
+# Cache of the venue and artist pages: 'memory' (per process) or 'file' (shared through CACHE_DIR)
+CACHE_BACKEND = 'memory'
+CACHE_DEFAULT_TIMEOUT = 300
+CACHE_MAX_ENTRIES = 1024
+CACHE_DIR = os.path.join(basedir, '.cache')
+
+# SQL statistics of each request, reported in the Server-Timing header, and logs of the slow and repeated statements
+SQL_INSTRUMENTATION = True
+SLOW_QUERY_MS = 200
+N_PLUS_ONE_THRESHOLD = 10
+
+# Read-only requests query this replica of the database when it is set. After writing, a client reads from the primary
+# for DATABASE_REPLICA_STICKINESS_SECONDS, which should exceed the replication lag, so that it sees its own writes.
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+DATABASE_REPLICA_STICKINESS_SECONDS = int(os.environ.get('DATABASE_REPLICA_STICKINESS_SECONDS', 10))
+
+# Background jobs, see jobs.py
+JOBS_DATABASE = os.environ.get('JOBS_DATABASE', os.path.join(basedir, 'jobs.sqlite3'))
+JOBS_WORKERS = 2
+JOBS_MAX_PENDING = 1000
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_DELAY = 1.0
+JOBS_ENQUEUE_TIMEOUT = 1.0
+JOBS_SYNCHRONOUS = False
@@ -0,0 +1,79 @@
+"""Materialized upcoming and past show counts of venues and artists.
+
+Writing a show recounts its venue and artist. Shows also move from upcoming to past as time passes, which no write
+reflects: run the rollover command periodically (for instance every few minutes from cron) to recount the venues and
+artists of the shows that started recently:
+
+    flask rollover-shows --window 60
+"""
+from datetime import timedelta
+
+import click
+from sqlalchemy import and_, event, func, inspect, select
+
+from flask_app import app
+from models import Artist, Show, Venue, current_time, db
+
+shows_table = Show.__table__
+
+
+def _count_shows(show_key, entity_id, criterion):
+    return select([func.count()]).where(and_(show_key == entity_id, criterion)).as_scalar()
+
+
+def refresh_show_counters(connection, venue_ids=None, artist_ids=None):
+    """Recounts the upcoming and past shows of the given venues and artists, or of all of them when ids are None.
+
+    Each table is updated by a single statement, counting through the indexes on the shows' foreign keys.
+    """
+    now = current_time()
+    for model, show_key, ids in ((Venue, shows_table.c.venue_id, venue_ids),
+                                 (Artist, shows_table.c.artist_id, artist_ids)):
+        table = model.__table__
+        update = table.update().values(
+            upcoming_shows_count=_count_shows(show_key, table.c.id, shows_table.c.start_time > now),
+            past_shows_count=_count_shows(show_key, table.c.id, shows_table.c.start_time < now),
+        )
+        if ids is not None:
+            ids = {int(id) for id in ids if id is not None}
+            if not ids:
+                continue
+            update = update.where(table.c.id.in_(ids))
+        connection.execute(update)
+
+
+def _referenced_ids(show, attribute):
+    """The ids `show` references through `attribute`, including the one it referenced before an update."""
+    return {getattr(show, attribute), *inspect(show).attrs[attribute].history.deleted}
+
+
+@event.listens_for(Show, 'after_insert')
+@event.listens_for(Show, 'after_update')
+@event.listens_for(Show, 'after_delete')
+def _recount_show_counters(mapper, connection, show):
+    refresh_show_counters(connection, _referenced_ids(show, 'venue_id'), _referenced_ids(show, 'artist_id'))
+
+
+def rollover_shows(window):
+    """Recounts the venues and artists of the shows that started during the last `window`."""
+    started = and_(Show.start_time > current_time() - window, Show.start_time <= current_time())
+    venue_ids = [venue_id for venue_id, in db.session.query(Show.venue_id).filter(started).distinct()]
+    artist_ids = [artist_id for artist_id, in db.session.query(Show.artist_id).filter(started).distinct()]
+    refresh_show_counters(db.session.connection(), venue_ids, artist_ids)
+    db.session.commit()
+    return len(venue_ids), len(artist_ids)
+
+
+@app.cli.command('rollover-shows')
+@click.option('--window', default=60, show_default=True,
+              help='Recount the venues and artists of the shows that started in the last WINDOW minutes.')
+@click.option('--full', is_flag=True, help='Recount every venue and artist instead.')
+def rollover_shows_command(window, full):
+    """Moves the shows that started recently from the upcoming to the past counters."""
+    if full:
+        refresh_show_counters(db.session.connection())
+        db.session.commit()
+        click.echo('Recounted every venue and artist')
+    else:
+        num_venues, num_artists = rollover_shows(timedelta(minutes=window))
+        click.echo(f'Recounted {num_venues} venues and {num_artists} artists')
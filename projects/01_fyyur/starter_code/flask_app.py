@@ -1,5 +1,10 @@
-from flask import Flask
+import time
+
+from flask import Flask, g, has_request_context, request
 from flask_moment import Moment
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, orm
+from sqlalchemy.pool import NullPool
 
 from config import SQLALCHEMY_DATABASE_URI
 
@@ -8,3 +13,91 @@ app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 moment = Moment(app)
 app.config.from_object('config')
+if app.config['DATABASE_REPLICA_URL']:
+    app.config['SQLALCHEMY_BINDS'] = {**(app.config.get('SQLALCHEMY_BINDS') or {}),
+                                      'replica': app.config['DATABASE_REPLICA_URL']}
+
+# Routes that only read, although they are POSTed to.
+READ_ONLY_ENDPOINTS = {'search_venues', 'search_artists'}
+# Holds the time until which the client's reads go to the primary database, because it wrote recently.
+PRIMARY_UNTIL_COOKIE = 'fyyur_primary_until'
+
+
+def postgres_engine_options(config):
+    """The create_engine options of a Postgres database, from the DATABASE_* settings."""
+    if config['DATABASE_PGBOUNCER']:
+        # PgBouncer already pools the server connections; a second pool in every worker would only hold them longer.
+        return {'poolclass': NullPool}
+    options = {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': config['DATABASE_POOL_PRE_PING'],
+    }
+    if config['DATABASE_STATEMENT_TIMEOUT_MS']:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DATABASE_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+
+def _reads_recently_written_data():
+    try:
+        return float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+@app.before_request
+def _route_reads():
+    """Sends the queries of read-only requests to the replica, unless the client wrote recently: replicas lag behind
+    the primary, and the client must see its own writes."""
+    g.read_from_replica = (bool((app.config['SQLALCHEMY_BINDS'] or {}).get('replica'))
+                           and (request.method in ('GET', 'HEAD') or request.endpoint in READ_ONLY_ENDPOINTS)
+                           and not _reads_recently_written_data())
+
+
+@app.after_request
+def _stick_to_primary_after_writes(response):
+    if request.method not in ('GET', 'HEAD') and request.endpoint not in READ_ONLY_ENDPOINTS \
+            and response.status_code < 400 and app.config['DATABASE_REPLICA_STICKINESS_SECONDS']:
+        response.set_cookie(PRIMARY_UNTIL_COOKIE, str(time.time() + app.config['DATABASE_REPLICA_STICKINESS_SECONDS']),
+                            max_age=app.config['DATABASE_REPLICA_STICKINESS_SECONDS'], httponly=True)
+    return response
+
+
+class RoutingSession(SignallingSession):
+    """Session reading from the 'replica' bind during read-only requests. Flushes, and so every write, go to the
+    primary database."""
+
+    def __init__(self, db, **options):
+        self._db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and has_request_context() and g.get('read_from_replica'):
+            return self._db.get_engine(self.app, bind='replica')
+        return super().get_bind(mapper, clause)
+
+
+class FyyurSQLAlchemy(SQLAlchemy):
+    """Routes the sessions between the primary database and its replica, and applies the connection pool settings of
+    the app config to Postgres engines. Other databases, such as the SQLite ones of the tests and benchmarks, keep
+    Flask-SQLAlchemy's defaults."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        if not sa_url.drivername.startswith('postgres'):
+            return super().create_engine(sa_url, engine_opts)
+        config = self.get_app().config
+        engine = super().create_engine(sa_url, {**engine_opts, **postgres_engine_options(config)})
+        timeout = config['DATABASE_STATEMENT_TIMEOUT_MS']
+        if config['DATABASE_PGBOUNCER'] and timeout:
+            # PgBouncer rejects startup options and hands the server connection to another client after each
+            # transaction, so the timeout is set for each transaction only. psycopg2 never prepares statements on the
+            # server, which PgBouncer's transaction mode does not support either.
+            @event.listens_for(engine, 'begin')
+            def set_statement_timeout(connection):
+                connection.execute(f'SET LOCAL statement_timeout = {int(timeout)}')
+        return engine
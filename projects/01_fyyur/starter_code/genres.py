@@ -0,0 +1,54 @@
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+
+from models import Genre, db
+
+
+class GenreLookup:
+    """In-memory table of genre ids by name, loaded on first use and dropped whenever a genre changes."""
+
+    def __init__(self):
+        self._ids_by_name = None
+        self._lock = threading.Lock()
+
+    def ids(self, names):
+        """Returns a mapping of genre names to ids that covers every known name of `names`."""
+        with self._lock:
+            if self._ids_by_name is None:
+                self._ids_by_name = dict(db.session.query(Genre.name, Genre.id))
+            ids_by_name = self._ids_by_name
+        missing = [name for name in names if name not in ids_by_name]
+        if missing:
+            # Another process may have added them since the table was loaded.
+            found = dict(db.session.query(Genre.name, Genre.id).filter(Genre.name.in_(missing)))
+            with self._lock:
+                if self._ids_by_name is not None:
+                    self._ids_by_name.update(found)
+            ids_by_name = {**ids_by_name, **found}
+        return ids_by_name
+
+    def resolve(self, names):
+        """Returns the genres named `names`, attached to the session, skipping unknown names.
+
+        Known genres cost no query at all: they are merged into the session from the table without being loaded.
+        """
+        ids_by_name = self.ids(names)
+        genres = []
+        for name in dict.fromkeys(names):
+            if name in ids_by_name:
+                genre = Genre(id=ids_by_name[name], name=name)
+                make_transient_to_detached(genre)
+                genres.append(db.session.merge(genre, load=False))
+        return genres
+
+    def invalidate(self, *args):
+        with self._lock:
+            self._ids_by_name = None
+
+
+genre_lookup = GenreLookup()
+
+for event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Genre, event_name, genre_lookup.invalidate)
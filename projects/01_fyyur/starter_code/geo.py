@@ -0,0 +1,70 @@
+"""Geohashes, which index venue locations with a plain B-tree on any database.
+
+A geohash names a cell of a grid over the globe, and every extra character splits a cell into 32 smaller ones, so the
+venues in a cell are those whose geohash starts with the cell's: a range scan of the index.
+"""
+from math import asin, ceil, cos, radians, sin, sqrt
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.19
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """The geohash of the cell of `precision` characters containing the point."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    value = 0
+    even = True
+    while len(geohash) < precision:
+        coordinate, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            geohash.append(BASE32[value])
+            bits = value = 0
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    """The height and width, in degrees, of the cells of `precision` characters."""
+    lat_bits = 5 * precision // 2
+    lon_bits = ceil(5 * precision / 2)
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def neighborhood(latitude, longitude, precision):
+    """The geohashes of the cell containing the point and of the 8 cells around it."""
+    height, width = cell_size(precision)
+    cells = set()
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            neighbor_latitude = min(max(latitude + dy * height, -90.0), 90.0)
+            neighbor_longitude = (longitude + dx * width + 180.0) % 360.0 - 180.0
+            cells.add(encode(neighbor_latitude, neighbor_longitude, precision))
+    return cells
+
+
+def covered_radius_km(latitude, precision):
+    """A distance within which every point lies in the `neighborhood` of precision `precision` of a point at this
+    latitude: the block of 3x3 cells extends at least one cell past the cell of the point in every direction."""
+    height, width = cell_size(precision)
+    return min(height * KM_PER_DEGREE, width * KM_PER_DEGREE * cos(radians(min(abs(latitude) + height, 90.0))))
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    """Great-circle distance between two points, by the haversine formula."""
+    latitude1, longitude1, latitude2, longitude2 = map(radians, (latitude1, longitude1, latitude2, longitude2))
+    a = sin((latitude2 - latitude1) / 2) ** 2 \
+        + cos(latitude1) * cos(latitude2) * sin((longitude2 - longitude1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
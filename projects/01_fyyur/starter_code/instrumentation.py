@@ -0,0 +1,97 @@
+"""Per-request SQL instrumentation.
+
+Every request counts its SQL statements and the time spent running them, and reports both in a `Server-Timing`
+header, which browsers show in their network tools. Statements slower than SLOW_QUERY_MS are logged with their bound
+parameters, and a warning is logged when a request runs the same statement more than N_PLUS_ONE_THRESHOLD times, which
+usually means a relationship is loaded once per row instead of once per page. Streamed pages only report the
+statements run before their first byte.
+"""
+import re
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from flask_app import app
+
+logger = app.logger.getChild('sql')
+
+# Parameter lists of IN clauses vary in length between runs of the same statement.
+_IN_PARAMETERS = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*\)')
+MAX_LOGGED_PARAMETERS_LENGTH = 1000
+
+
+class RequestStats:
+    """The statements run during one request."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.statements = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, duration):
+        self.statements += 1
+        self.db_time += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated_statements(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+def statement_shape(statement):
+    """`statement` with its whitespace and the length of its IN lists normalized."""
+    return _IN_PARAMETERS.sub('(?)', ' '.join(statement.split()))
+
+
+def _format_parameters(parameters):
+    text = repr(parameters)
+    if len(text) > MAX_LOGGED_PARAMETERS_LENGTH:
+        text = text[:MAX_LOGGED_PARAMETERS_LENGTH] + '...'
+    return text
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_started_at'].pop()
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+    if duration * 1000 >= app.config['SLOW_QUERY_MS']:
+        logger.warning('Slow query (%.1f ms): %s\nParameters: %s', duration * 1000, ' '.join(statement.split()),
+                       _format_parameters(parameters))
+    if has_request_context() and 'sql_stats' in g:
+        g.sql_stats.record(statement, duration)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _drop_timer(context):
+    # after_cursor_execute does not run for failed statements: their start times would pile up on the connection.
+    if context.connection is not None and context.connection.info.get('query_started_at'):
+        context.connection.info['query_started_at'].pop()
+
+
+@app.before_request
+def _start_request_stats():
+    if app.config['SQL_INSTRUMENTATION']:
+        g.sql_stats = RequestStats()
+
+
+@app.after_request
+def _report_request_stats(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+    for shape, count in stats.repeated_statements(app.config['N_PLUS_ONE_THRESHOLD']):
+        logger.warning('Possible N+1 query on %s %s: statement run %d times: %s', request.method, request.path,
+                       count, shape)
+    total_time = time.perf_counter() - stats.started_at
+    response.headers.add('Server-Timing', f'db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} queries"')
+    response.headers.add('Server-Timing', f'app;dur={total_time * 1000:.1f}')
+    return response
@@ -0,0 +1,280 @@
+"""In-process background jobs, so that side effects of writes do not add to the latency of the request.
+
+Jobs are functions registered with `job_queue.task` and enqueued by name with JSON arguments:
+
+    @job_queue.task
+    def invalidate_pages_showing(entity, id):
+        ...
+
+    job_queue.enqueue('invalidate_pages_showing', 'venue', 1)
+
+The queue lives in a SQLite file (JOBS_DATABASE), so jobs survive restarts and every process on the machine can share
+it; a pool of JOBS_WORKERS threads, started with the app, runs them inside an app context. Jobs registered with
+`job_queue.task(local=True)`, such as those clearing a per-process cache, only run in the process that enqueued them. A
+failing job is retried up to JOBS_MAX_ATTEMPTS times, waiting JOBS_RETRY_DELAY seconds and twice as long after each
+attempt. Once JOBS_MAX_PENDING jobs wait, enqueueing blocks for up to JOBS_ENQUEUE_TIMEOUT seconds and then raises
+QueueFull, for the caller to run the job itself or give up. Workers log the errors of the queue itself, such as a
+database locked for too long, and carry on. With JOBS_SYNCHRONOUS set, as in the tests, jobs run as soon as they are
+enqueued.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from collections import Counter
+
+from flask import jsonify
+
+from flask_app import app
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    args TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at REAL NOT NULL,
+    started_at REAL,
+    last_error TEXT,
+    owner INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at);
+'''
+# Running jobs that have not finished after this many seconds belong to a process that died; they are run again, unless
+# they are local to that process.
+STALE_AFTER = 600
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+
+    def __init__(self, path, workers=2, max_pending=1000, max_attempts=5, retry_delay=1.0, enqueue_timeout=1.0,
+                 synchronous=False):
+        self.path = path
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.enqueue_timeout = enqueue_timeout
+        self.synchronous = synchronous
+        self.tasks = {}
+        self.local_tasks = set()
+        self.metrics = Counter()
+        self._local = threading.local()
+        self._changed = threading.Condition()
+        self._threads = []
+        self._threads_pid = None
+        self._stopping = False
+        # Bumped by every enqueue, so that workers do not go to sleep right after missing a new job.
+        self._generation = 0
+
+    def task(self, function=None, local=False):
+        """Registers `function` as a job, under its name. Local jobs only run in the process that enqueued them."""
+        if function is None:
+            return lambda function: self.task(function, local)
+        self.tasks[function.__name__] = function
+        if local:
+            self.local_tasks.add(function.__name__)
+        return function
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+            # Queue files from before local jobs. The check and the change are one transaction, as other threads and
+            # processes may be opening the file too.
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                if 'owner' not in {column[1] for column in connection.execute('PRAGMA table_info(jobs)')}:
+                    connection.execute('ALTER TABLE jobs ADD COLUMN owner INTEGER')
+            finally:
+                connection.execute('COMMIT')
+            self._local.connection = connection
+        return connection
+
+    def pending(self):
+        return self._connection().execute("SELECT count(*) FROM jobs WHERE status IN ('pending', 'running')") \
+            .fetchone()[0]
+
+    def enqueue(self, name, *args):
+        """Queues the job `name` to run with `args`. Raises QueueFull if the queue stays full for too long."""
+        if name not in self.tasks:
+            raise KeyError(f'Unknown job {name!r}')
+        if self.synchronous:
+            self.metrics['enqueued'] += 1
+            self._run(name, args)
+            return None
+        deadline = time.monotonic() + self.enqueue_timeout
+        with self._changed:
+            while self.pending() >= self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics['rejected'] += 1
+                    raise QueueFull(f'{self.max_pending} jobs are already waiting')
+                self._changed.wait(min(remaining, 0.1))
+            owner = os.getpid() if name in self.local_tasks else None
+            cursor = self._connection().execute('INSERT INTO jobs (name, args, run_at, owner) VALUES (?, ?, ?, ?)',
+                                                (name, json.dumps(args), time.time(), owner))
+            self.metrics['enqueued'] += 1
+            self._generation += 1
+            self._changed.notify_all()
+        self.start()
+        return cursor.lastrowid
+
+    def _claim(self):
+        """Marks the next due job as running and returns it, or returns the delay until the next one is due."""
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running' AND started_at < ?",
+                               (now - STALE_AFTER,))
+            # Local jobs of processes that died would never run.
+            connection.execute("DELETE FROM jobs WHERE owner != ? AND status != 'failed' AND run_at < ?",
+                               (os.getpid(), now - STALE_AFTER))
+            job = connection.execute("SELECT id, name, args, attempts, run_at FROM jobs WHERE status = 'pending' "
+                                     "AND (owner IS NULL OR owner = ?) ORDER BY run_at LIMIT 1",
+                                     (os.getpid(),)).fetchone()
+            if job is None:
+                return None, None
+            id, name, args, attempts, run_at = job
+            if run_at > now:
+                return None, run_at - now
+            connection.execute("UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 "
+                               "WHERE id = ?", (now, id))
+            return (id, name, json.loads(args), attempts + 1), None
+        finally:
+            connection.execute('COMMIT')
+
+    def _run(self, name, args):
+        start = time.perf_counter()
+        try:
+            with app.app_context():
+                self.tasks[name](*args)
+        finally:
+            self.metrics['run_time'] += time.perf_counter() - start
+
+    def _finish(self, id, attempts, error):
+        connection = self._connection()
+        if error is None:
+            self.metrics['succeeded'] += 1
+            connection.execute('DELETE FROM jobs WHERE id = ?', (id,))
+        elif attempts < self.max_attempts:
+            self.metrics['retried'] += 1
+            connection.execute("UPDATE jobs SET status = 'pending', run_at = ?, last_error = ? WHERE id = ?",
+                               (time.time() + self.retry_delay * 2 ** (attempts - 1), error, id))
+        else:
+            self.metrics['failed'] += 1
+            app.logger.error('Job %s failed %d times, giving up:\n%s', id, attempts, error)
+            connection.execute("UPDATE jobs SET status = 'failed', last_error = ? WHERE id = ?", (error, id))
+        with self._changed:
+            self._changed.notify_all()
+
+    def work_once(self):
+        """Runs the next due job, if any. Returns whether there was one, or else how long until the next is due."""
+        job, delay = self._claim()
+        if job is None:
+            return False, delay
+        id, name, args, attempts = job
+        try:
+            self._run(name, args)
+            error = None
+        except Exception:
+            error = traceback.format_exc()
+        self._finish(id, attempts, error)
+        return True, None
+
+    def enqueue_or_run(self, name, *args):
+        """Queues the job, or runs it right away when the queue is full or cannot be written to."""
+        if self.synchronous:
+            # enqueue runs the job: running it again after it failed would not help.
+            return self.enqueue(name, *args)
+        try:
+            return self.enqueue(name, *args)
+        except QueueFull:
+            pass
+        except Exception:
+            app.logger.exception('Could not enqueue job %s, running it now', name)
+        self._run(name, args)
+
+    def _work(self):
+        while not self._stopping:
+            generation = self._generation
+            try:
+                ran, delay = self.work_once()
+            except Exception:
+                app.logger.exception('Job worker failed, trying again')
+                connection = self._connection()
+                if connection.in_transaction:
+                    connection.execute('ROLLBACK')
+                ran, delay = False, self.retry_delay
+            if not ran:
+                with self._changed:
+                    # Jobs enqueued by other processes are picked up within a second.
+                    if self._generation == generation and not self._stopping:
+                        self._changed.wait(min(delay, 1.0) if delay is not None else 1.0)
+
+    def start(self):
+        """Starts the worker threads, once per process: threads do not survive a fork."""
+        with self._changed:
+            if self.synchronous or (self._threads and self._threads_pid == os.getpid()):
+                return
+            self._stopping = False
+            self._threads_pid = os.getpid()
+            self._threads = [threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                             for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def wait_until_idle(self, timeout=10):
+        """Waits until no job is pending or running, for at most `timeout` seconds. Returns whether it is idle."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self.pending():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(min(remaining, 0.1))
+        return True
+
+    def stats(self):
+        """Counts of this process' jobs since it started, and of the jobs in the queue by status."""
+        by_status = dict(self._connection().execute('SELECT status, count(*) FROM jobs GROUP BY status'))
+        return {**self.metrics, 'pending': by_status.get('pending', 0), 'running': by_status.get('running', 0),
+                'failed_in_queue': by_status.get('failed', 0)}
+
+
+def create_job_queue(config):
+    return JobQueue(config['JOBS_DATABASE'], workers=config['JOBS_WORKERS'], max_pending=config['JOBS_MAX_PENDING'],
+                    max_attempts=config['JOBS_MAX_ATTEMPTS'], retry_delay=config['JOBS_RETRY_DELAY'],
+                    enqueue_timeout=config['JOBS_ENQUEUE_TIMEOUT'], synchronous=config['JOBS_SYNCHRONOUS'])
+
+
+job_queue = create_job_queue(app.config)
+
+
+@app.before_first_request
+def _start_job_workers():
+    # Jobs queued before a restart run without waiting for the next write to start the workers.
+    job_queue.start()
+
+
+@app.route('/jobs/stats')
+def job_stats():
+    return jsonify(job_queue.stats())
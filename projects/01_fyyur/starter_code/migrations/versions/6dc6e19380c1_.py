@@ -0,0 +1,35 @@
+"""trigram search indexes on Venue and Artist
+
+Revision ID: 6dc6e19380c1
+Revises: 202dd24df2fd
+Create Date: 2026-10-18 10:02:41.553870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6dc6e19380c1'
+down_revision = '202dd24df2fd'
+branch_labels = None
+depends_on = None
+
+SEARCHED_COLUMNS = {
+    'Venue': ('name', 'city', 'state'),
+    'Artist': ('name', 'city', 'state'),
+}
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table_name, columns in SEARCHED_COLUMNS.items():
+        for column in columns:
+            op.create_index(f'ix_{table_name}_{column}_trgm', table_name, [column], unique=False,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    for table_name, columns in SEARCHED_COLUMNS.items():
+        for column in columns:
+            op.drop_index(f'ix_{table_name}_{column}_trgm', table_name=table_name)
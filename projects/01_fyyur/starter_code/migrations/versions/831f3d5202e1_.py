@@ -0,0 +1,27 @@
+"""venue directory index on areas with missing states and cities as empty ones
+
+Revision ID: 831f3d5202e1
+Revises: 9163d30b7080
+Create Date: 2026-10-18 21:12:05.318264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '831f3d5202e1'
+down_revision = '9163d30b7080'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Venue_area_id', 'Venue',
+                    [sa.text("coalesce(state, '')"), sa.text("coalesce(city, '')"), 'id'], unique=False)
+    op.drop_index('ix_Venue_state_city_id', table_name='Venue')
+
+
+def downgrade():
+    op.create_index('ix_Venue_state_city_id', 'Venue', ['state', 'city', 'id'], unique=False)
+    op.drop_index('ix_Venue_area_id', table_name='Venue')
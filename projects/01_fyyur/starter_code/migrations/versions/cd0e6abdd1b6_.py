@@ -0,0 +1,35 @@
+"""materialized show counters on Venue and Artist
+
+Revision ID: cd0e6abdd1b6
+Revises: 41b1c77e27ab
+Create Date: 2026-10-18 13:05:52.441973
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cd0e6abdd1b6'
+down_revision = '41b1c77e27ab'
+branch_labels = None
+depends_on = None
+
+# The counters compare with the naive local time the application uses.
+COUNT_SHOWS = '(SELECT count(*) FROM "Shows" ' \
+              'WHERE "Shows".{key} = "{table}".id AND "Shows".start_time {operator} LOCALTIMESTAMP)'
+
+
+def upgrade():
+    for table, key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        upcoming = COUNT_SHOWS.format(key=key, table=table, operator='>')
+        past = COUNT_SHOWS.format(key=key, table=table, operator='<')
+        op.execute(f'UPDATE "{table}" SET upcoming_shows_count = {upcoming}, past_shows_count = {past}')
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
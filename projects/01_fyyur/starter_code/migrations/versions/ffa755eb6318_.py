@@ -0,0 +1,29 @@
+"""updated_at on Venue, Artist and Shows
+
+Revision ID: ffa755eb6318
+Revises: 0141fb21e9cd
+Create Date: 2026-10-18 17:21:08.664120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ffa755eb6318'
+down_revision = '0141fb21e9cd'
+branch_labels = None
+depends_on = None
+
+# The application writes naive UTC times.
+NOW_UTC = sa.text("timezone('utc', now())")
+
+
+def upgrade():
+    for table in ('Venue', 'Artist', 'Shows'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=NOW_UTC, nullable=False))
+
+
+def downgrade():
+    for table in ('Venue', 'Artist', 'Shows'):
+        op.drop_column(table, 'updated_at')
@@ -1,65 +1,123 @@
 from datetime import datetime
 
+from flask import g, has_request_context
 from flask_migrate import Migrate
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import DateTime, ForeignKey, event, func, literal_column
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.orm import joinedload, object_session, relationship
 
-from flask_app import app
+from flask_app import FyyurSQLAlchemy, app
+from geo import encode as geohash_encode
 
-db = SQLAlchemy(app)
+db = FyyurSQLAlchemy(app)
 migrate = Migrate(app, db, compare_type=True)
 
 artist_genres_table = db.Table('ArtistGenres',
                                db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
-                               db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
+                               db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True),
+                               db.Index('ix_ArtistGenres_artist_id', 'artist_id')
                                )
 
 venue_genres_table = db.Table('VenueGenres',
                               db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
-                              db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
+                              db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True),
+                              db.Index('ix_VenueGenres_venue_id', 'venue_id')
                               )
 
 
+def current_time():
+    """The time shows are split into past and upcoming at. It is taken once per request, so every query of a request
+    agrees on which shows are upcoming."""
+    if not has_request_context():
+        return datetime.now()
+    if 'now' not in g:
+        g.now = datetime.now()
+    return g.now
+
+
+class utcnow(FunctionElement):
+    """The current UTC time, as the default of columns holding naive UTC datetimes like datetime.utcnow() ones."""
+    type = DateTime()
+
+
+@compiles(utcnow)
+def _utcnow_default(element, compiler, **kw):
+    # SQLite's CURRENT_TIMESTAMP is UTC.
+    return 'CURRENT_TIMESTAMP'
+
+
+@compiles(utcnow, 'postgresql')
+def _utcnow_postgresql(element, compiler, **kw):
+    # As in migration ffa755eb6318: now() is in the time zone of the session.
+    return "timezone('utc', now())"
+
+
+def updated_at_column():
+    """When the row last changed, which the pages displaying it derive their ETag and Last-Modified headers from.
+
+    Any UPDATE bumps it, including the bulk ones of counters.py; the ORM also bumps it when only genres change."""
+    return db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                     server_default=utcnow())
+
+
+def trigram_indexes(table_name, *columns):
+    """GIN trigram indexes on Postgres (they serve `ILIKE '%term%'` searches), plain indexes elsewhere."""
+    return tuple(db.Index(f'ix_{table_name}_{column}_trgm', column,
+                          postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+                 for column in columns)
+
+
 class Genre(db.Model):
     __tablename__ = 'Genre'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
+    name = db.Column(db.String, unique=True, index=True)
 
 
 class Show(db.Model):
     __tablename__ = 'Shows'
+    __table_args__ = (
+        # The past and upcoming shows of a venue or an artist, and the /shows listing sorted by time.
+        db.Index('ix_Shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Shows_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Shows_start_time_id', 'start_time', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, ForeignKey('Venue.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
     artist_id = db.Column(db.Integer, ForeignKey('Artist.id'), nullable=False)
+    updated_at = updated_at_column()
+
+    @classmethod
+    def is_past(cls):
+        return cls.start_time < current_time()
+
+    @classmethod
+    def is_upcoming(cls):
+        return cls.start_time > current_time()
 
     @property
     def artist_name(self):
-        artist = Artist.query.filter_by(id=self.artist_id).first()
-        return artist.name
+        return self.artist.name
 
     @property
     def artist_image_link(self):
-        artist = Artist.query.filter_by(id=self.artist_id).first()
-        return artist.image_link
+        return self.artist.image_link
 
     @property
     def venue_name(self):
-        venue = Venue.query.filter_by(id=self.venue_id).first()
-        return venue.name
+        return self.venue.name
 
     @property
     def venue_image_link(self):
-        venue = Venue.query.filter_by(id=self.venue_id).first()
-        return venue.image_link
+        return self.venue.image_link
 
     def serialize(self):
         return {
             'artist_id': self.artist_id,
             'artist_name': self.artist_name,
             'artist_image_link': self.artist_image_link,
-            'start_time': self.start_time.strftime('%Y-%m-%d %H:%M:%S')
+            'start_time': self.start_time
         }
 
     def serialize_for_artist(self):
@@ -67,22 +125,23 @@ class Show(db.Model):
             "venue_id": self.venue_id,
             "venue_name": self.venue_name,
             "venue_image_link": self.venue_image_link,
-            "start_time": self.start_time.strftime('%Y-%m-%d %H:%M:%S')
+            "start_time": self.start_time
         }
 
     def serialize_for_all_upcoming_shows_page(self):
         return {
-            "venue_id": self.id,
+            "venue_id": self.venue_id,
             "venue_name": self.venue_name,
             "artist_id": self.artist_id,
             "artist_name": self.artist_name,
             "artist_image_link": self.artist_image_link,
-            "start_time": self.start_time.strftime('%Y-%m-%d %H:%M:%S')
+            "start_time": self.start_time
         }
 
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = trigram_indexes('Venue', 'name', 'city', 'state')
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     address = db.Column(db.String(120))
@@ -94,6 +153,14 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
+    # Optional location. The geohash of the location is kept up to date from it, and indexed for proximity searches.
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
+    # Materialized by counters.py: kept up to date as shows are written, and as time passes by the rollover command.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = updated_at_column()
 
     genres = relationship("Genre", secondary=venue_genres_table)
     shows = relationship("Show", backref="venue")
@@ -104,23 +171,22 @@ class Venue(db.Model):
                f"seeking_talent={self.seeking_talent}, seeking_description={self.seeking_description}, " \
                f"image_link={self.image_link}, genres={self.genres}, shows={self.shows})"
 
-    @property
-    def upcoming_shows_count(self):
-        return len(self.upcoming_shows)
-
-    @property
-    def past_shows_count(self):
-        return len(self.past_shows)
+    def _shows_query(self, criterion):
+        return Show.query.filter(Show.venue_id == self.id, criterion)
 
     @property
     def past_shows(self):
-        return [show.serialize() for show in self.shows if show.start_time < datetime.now()]
+        shows = self._shows_query(Show.is_past()).options(joinedload(Show.artist)).order_by(Show.start_time.desc())
+        return [show.serialize() for show in shows]
 
     @property
     def upcoming_shows(self):
-        return [show.serialize() for show in self.shows if show.start_time > datetime.now()]
+        shows = self._shows_query(Show.is_upcoming()).options(joinedload(Show.artist)).order_by(Show.start_time)
+        return [show.serialize() for show in shows]
 
     def serialize(self):
+        past_shows = self.past_shows
+        upcoming_shows = self.upcoming_shows
         return {
             "id": self.id,
             "name": self.name,
@@ -134,15 +200,27 @@ class Venue(db.Model):
             "seeking_talent": self.seeking_talent,
             "seeking_description": self.seeking_description,
             "image_link": self.image_link,
-            "past_shows": self.past_shows,
-            "upcoming_shows": self.upcoming_shows,
-            "past_shows_count": self.past_shows_count,
-            "upcoming_shows_count": self.upcoming_shows_count
+            "past_shows": past_shows,
+            "upcoming_shows": upcoming_shows,
+            "past_shows_count": len(past_shows),
+            "upcoming_shows_count": len(upcoming_shows)
         }
 
 
+# The venue directory sorted by area. Venues without a state or city sort as if it were empty: a keyset cursor holding
+# a NULL would compare as unknown against every row, and end the directory there. The '' is a literal, as SQLite only
+# uses an expression index for a query written exactly like it.
+def _or_empty(column):
+    return func.coalesce(column, literal_column("''"))
+
+
+db.Index('ix_Venue_area_id', _or_empty(Venue.state), _or_empty(Venue.city), Venue.id)
+VENUE_DIRECTORY_ORDER = (_or_empty(Venue.state).label('area_state'), _or_empty(Venue.city).label('area_city'), Venue.id)
+
+
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = trigram_indexes('Artist', 'name', 'city', 'state')
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
@@ -153,27 +231,30 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String())
     image_link = db.Column(db.String(500))
+    # Materialized by counters.py: kept up to date as shows are written, and as time passes by the rollover command.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = updated_at_column()
 
     genres = relationship("Genre", secondary=artist_genres_table)
-    shows = relationship("Show")
+    shows = relationship("Show", backref="artist")
+
+    def _shows_query(self, criterion):
+        return Show.query.filter(Show.artist_id == self.id, criterion)
 
     @property
     def past_shows(self):
-        return [show.serialize_for_artist() for show in self.shows if show.start_time < datetime.now()]
+        shows = self._shows_query(Show.is_past()).options(joinedload(Show.venue)).order_by(Show.start_time.desc())
+        return [show.serialize_for_artist() for show in shows]
 
     @property
     def upcoming_shows(self):
-        return [show.serialize_for_artist() for show in self.shows if show.start_time > datetime.now()]
-
-    @property
-    def upcoming_shows_count(self):
-        return len(self.upcoming_shows)
-
-    @property
-    def past_shows_count(self):
-        return len(self.past_shows)
+        shows = self._shows_query(Show.is_upcoming()).options(joinedload(Show.venue)).order_by(Show.start_time)
+        return [show.serialize_for_artist() for show in shows]
 
     def serialize(self):
+        past_shows = self.past_shows
+        upcoming_shows = self.upcoming_shows
         return {
             "id": self.id,
             "name": self.name,
@@ -186,8 +267,28 @@ class Artist(db.Model):
             "seeking_venue": self.seeking_venue,
             "seeking_description": self.seeking_description,
             "image_link": self.image_link,
-            "past_shows": self.past_shows,
-            "upcoming_shows": self.upcoming_shows,
-            "past_shows_count": self.past_shows_count,
-            "upcoming_shows_count": self.upcoming_shows_count,
+            "past_shows": past_shows,
+            "upcoming_shows": upcoming_shows,
+            "past_shows_count": len(past_shows),
+            "upcoming_shows_count": len(upcoming_shows),
         }
+
+
+@event.listens_for(Venue, 'before_update')
+@event.listens_for(Artist, 'before_update')
+def _touch(mapper, connection, target):
+    # Changing only the genres of a venue or an artist updates no column, so onupdate would not fire.
+    if object_session(target).is_modified(target):
+        target.updated_at = datetime.utcnow()
+
+
+def geohash_of(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    return geohash_encode(float(latitude), float(longitude))
+
+
+@event.listens_for(Venue, 'before_insert')
+@event.listens_for(Venue, 'before_update')
+def _locate(mapper, connection, target):
+    target.geohash = geohash_of(target.latitude, target.longitude)
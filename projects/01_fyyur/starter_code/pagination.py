@@ -0,0 +1,61 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import namedtuple
+from datetime import datetime
+
+from flask import abort
+from sqlalchemy import DateTime, Integer, String, tuple_
+
+PAGE_SIZE = 50
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _decode_value(column, value):
+    if isinstance(column.type, DateTime) and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Integer) and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(column.type, String) and isinstance(value, str):
+        return value
+    raise ValueError(f'{value!r} is not a value of {column}')
+
+
+def decode_cursor(cursor, columns):
+    """Decodes a cursor made by `encode_cursor` back into values of `columns`. Aborts with a 400 if it is malformed,
+    which includes values that are not of the type of their column, so that crafted cursors never reach the SQL."""
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError('cursor does not match the sort order')
+        return tuple(_decode_value(column, value) for column, value in zip(columns, values))
+    except (TypeError, ValueError):
+        abort(400)
+
+
+def keyset_query(query, columns, cursor=None, per_page=PAGE_SIZE):
+    """`query` restricted to the rows of the page following `cursor`, plus the first row of the next page."""
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        # The bound on the first column lets SQLite seek an expression index, which it does not for row values alone.
+        query = query.filter(columns[0] >= values[0], tuple_(*columns) > tuple_(*values))
+    return query.order_by(*columns).limit(per_page + 1)
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=PAGE_SIZE):
+    """Returns the page of `query` that follows `cursor` when sorted by `columns`.
+
+    Rows are sorted by `columns`, which must end with a unique column, and the page starts strictly after the
+    position encoded in the cursor. The database can seek straight to it through an index on `columns` instead of
+    skipping rows as OFFSET does, so every page costs the same. Rows of the query must expose each column by its key.
+    """
+    rows = keyset_query(query, columns, cursor, per_page).all()
+    if len(rows) <= per_page:
+        return Page(rows, None)
+    last = rows[per_page - 1]
+    return Page(rows[:per_page], encode_cursor([getattr(last, column.key) for column in columns]))
@@ -0,0 +1,143 @@
+from itertools import groupby
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from geo import covered_radius_km, distance_km, neighborhood
+from models import VENUE_DIRECTORY_ORDER, Artist, Show, Venue, db
+from pagination import PAGE_SIZE, Page, keyset_paginate, keyset_query
+from streaming import STREAM_BATCH_SIZE
+
+# Eager loading options used by each page, so that serializing a page costs a fixed number of queries instead of one
+# (or more) per show. Options are built lazily because the backref relationships only exist once mappers configure.
+PAGE_LOADERS = {
+    'shows': lambda: (joinedload(Show.artist), joinedload(Show.venue)),
+    'show_venue': lambda: (selectinload(Venue.genres),),
+    'show_artist': lambda: (selectinload(Artist.genres),),
+}
+
+
+def with_page_loaders(query, page):
+    """Applies the eager loading preset of `page` to `query`."""
+    return query.options(*PAGE_LOADERS[page]())
+
+
+def _venue_directory_query():
+    return db.session.query(Venue.city, Venue.state, Venue.id, Venue.name, Venue.upcoming_shows_count,
+                            *VENUE_DIRECTORY_ORDER[:2])
+
+
+def _group_into_areas(rows):
+    """Groups rows sorted by state and city into areas, lazily, one area at a time."""
+    for (city, state), venues in groupby(rows, key=lambda row: (row[0], row[1])):
+        yield {
+            "city": city,
+            "state": state,
+            "venues": [{
+                "id": venue_id,
+                "name": name,
+                "num_upcoming_shows": num_upcoming_shows
+            } for _, _, venue_id, name, num_upcoming_shows, _, _ in venues]
+        }
+
+
+def venue_directory(cursor=None, per_page=PAGE_SIZE):
+    """Returns a page of venues grouped by city and state, with the number of upcoming shows of each venue.
+
+    The page is fetched by a single query reading the materialized show counters of the venues, no matter how many
+    venues or shows there are. Venues are sorted by state, city and id, so an area may continue on the next page.
+    """
+    rows, next_cursor = keyset_paginate(_venue_directory_query(), VENUE_DIRECTORY_ORDER, cursor, per_page)
+    return Page(list(_group_into_areas(rows)), next_cursor)
+
+
+def stream_venue_directory(batch_size=STREAM_BATCH_SIZE):
+    """Yields the areas of the whole venue directory, reading venues from a server-side cursor `batch_size` at a
+    time."""
+    rows = _venue_directory_query().order_by(*VENUE_DIRECTORY_ORDER).yield_per(batch_size)
+    return _group_into_areas(rows)
+
+
+def stream_shows(batch_size=STREAM_BATCH_SIZE):
+    """Yields every show serialized for the shows page, reading them from a server-side cursor `batch_size` at a
+    time."""
+    shows = with_page_loaders(Show.query, 'shows').order_by(Show.start_time, Show.id).yield_per(batch_size)
+    return (show.serialize_for_all_upcoming_shows_page() for show in shows)
+
+
+# Geohash precision the search for the nearest venues starts at: cells of about 1.2 by 0.6 km.
+NEAREST_START_PRECISION = 6
+
+
+def _venues_in_cells(cells):
+    # Range conditions rather than LIKE, which not every database serves from an index. '{' sorts after every
+    # geohash character.
+    in_cells = or_(*[and_(Venue.geohash >= cell, Venue.geohash < cell + '{') for cell in cells])
+    return db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.latitude, Venue.longitude,
+                            Venue.upcoming_shows_count).filter(in_cells)
+
+
+def nearest_venues(latitude, longitude, k=10):
+    """The `k` venues nearest to the point, nearest first, as (venue row, distance in km) pairs.
+
+    Venues are looked up in the geohash cell of the point and the 8 around it, and in ever larger cells until the
+    k-th nearest one found is closer than any venue outside the cells can be. Each lookup reads a few ranges of the
+    geohash index, so the cost depends on the number of venues around the point, not on the total.
+    """
+    for precision in range(NEAREST_START_PRECISION, 0, -1):
+        rows = _venues_in_cells(neighborhood(latitude, longitude, precision)).all()
+        if len(rows) < k:
+            continue
+        nearest = _by_distance(rows, latitude, longitude)[:k]
+        if nearest[-1][1] <= covered_radius_km(latitude, precision):
+            return nearest
+    return _by_distance(_venues_in_cells(['']).all(), latitude, longitude)[:k]
+
+
+def _by_distance(rows, latitude, longitude):
+    return sorted(((row, distance_km(latitude, longitude, row.latitude, row.longitude)) for row in rows),
+                  key=lambda pair: pair[1])
+
+
+# Revisions: cheap queries whose result changes whenever the page they stand for would, used as the page's validator
+# for conditional requests.
+
+def _page_revision(page_query):
+    """The number of rows of `page_query`, the sum of their ids and their latest update times.
+
+    A row being added to the page or removed from it changes the count or the sum, and a row changing its updated_at.
+    """
+    page = page_query.subquery()
+    updated_at_columns = [column for column in page.c if column.name.endswith('updated_at')]
+    return tuple(db.session.query(func.count(), func.sum(page.c.id), *map(func.max, updated_at_columns)).one())
+
+
+def venue_directory_revision(cursor=None, per_page=PAGE_SIZE):
+    query = db.session.query(Venue.id, Venue.updated_at, *VENUE_DIRECTORY_ORDER[:2])
+    return _page_revision(keyset_query(query, VENUE_DIRECTORY_ORDER, cursor, per_page))
+
+
+def shows_revision(cursor=None, per_page=PAGE_SIZE):
+    query = db.session.query(Show.id, Show.updated_at, Venue.updated_at.label('venue_updated_at'),
+                             Artist.updated_at.label('artist_updated_at')) \
+        .join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+    return _page_revision(keyset_query(query, (Show.start_time, Show.id), cursor, per_page))
+
+
+def _entity_revision(model, show_key, other_model, other_key, id):
+    # The entity's own updated_at also moves when its shows change, as their counters are recounted.
+    others_updated_at = select([func.max(other_model.updated_at)]) \
+        .select_from(Show.__table__.join(other_model.__table__, other_key == other_model.id)) \
+        .where(show_key == id).as_scalar()
+    revision = db.session.query(model.updated_at, others_updated_at).filter(model.id == id).first()
+    return tuple(revision) if revision else None
+
+
+def venue_revision(venue_id):
+    """The update times of the venue and of the artists of its shows, or None if there is no such venue."""
+    return _entity_revision(Venue, Show.venue_id, Artist, Show.artist_id, venue_id)
+
+
+def artist_revision(artist_id):
+    """The update times of the artist and of the venues of its shows, or None if there is no such artist."""
+    return _entity_revision(Artist, Show.artist_id, Venue, Show.venue_id, artist_id)
@@ -0,0 +1,61 @@
+from sqlalchemy import case, func, or_, select, union
+
+from models import Artist, Genre, Venue, artist_genres_table, db, venue_genres_table
+
+SEARCH_RESULTS_PER_PAGE = 20
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _search(model, genre_entity_id, search_term, page, per_page):
+    """Searches `model` by name, city, state and genre, ranked by how well the name matches.
+
+    Exact names come first, then names starting with the term, then names containing it, then rows that only matched
+    on their location or genres. On Postgres the ILIKE filters are served by the trigram indexes declared on the
+    models. The rows matching by genre are looked up separately, through the genres association table whose
+    `genre_entity_id` column holds their ids, and united with the others: an EXISTS on the genres ORed with the ILIKEs
+    would keep Postgres from combining the indexes, and make it scan the whole table. Returns the total number of
+    matches and one page of results, each with its number of upcoming shows.
+    """
+    page = max(page, 1)
+    term = _escape_like(search_term)
+    pattern = f'%{term}%'
+    genres_table = genre_entity_id.table
+    matching_ids = union(
+        select([model.id]).where(or_(model.name.ilike(pattern, escape='\\'),
+                                     model.city.ilike(pattern, escape='\\'),
+                                     model.state.ilike(pattern, escape='\\'))),
+        select([genre_entity_id]).select_from(genres_table.join(Genre, Genre.id == genres_table.c.genre_id))
+        .where(Genre.name.ilike(pattern, escape='\\')),
+    )
+    matches = model.id.in_(matching_ids)
+    rank = case([(func.lower(model.name) == search_term.lower(), 0),
+                 (model.name.ilike(f'{term}%', escape='\\'), 1),
+                 (model.name.ilike(pattern, escape='\\'), 2)],
+                else_=3)
+    rows = db.session.query(model.id, model.name, model.upcoming_shows_count) \
+        .filter(matches) \
+        .order_by(rank, model.name, model.id) \
+        .limit(per_page) \
+        .offset((page - 1) * per_page) \
+        .all()
+    return {
+        "count": model.query.filter(matches).count(),
+        "page": page,
+        "per_page": per_page,
+        "data": [{
+            "id": id,
+            "name": name,
+            "num_upcoming_shows": num_upcoming_shows,
+        } for id, name, num_upcoming_shows in rows]
+    }
+
+
+def find_venues(search_term, page=1, per_page=SEARCH_RESULTS_PER_PAGE):
+    return _search(Venue, venue_genres_table.c.venue_id, search_term, page, per_page)
+
+
+def find_artists(search_term, page=1, per_page=SEARCH_RESULTS_PER_PAGE):
+    return _search(Artist, artist_genres_table.c.artist_id, search_term, page, per_page)
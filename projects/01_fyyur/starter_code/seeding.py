@@ -0,0 +1,163 @@
+"""Generates realistic looking venues, artists, genres and shows, for benchmarks and local development:
+
+    flask seed --shows 100000 --yes
+
+There is one venue for every SHOWS_PER_VENUE shows and one artist for every SHOWS_PER_ARTIST shows. A few venues and
+artists get most of the shows, as on the real site, and the shows spread over the past two years and the next one.
+"""
+import random
+from datetime import datetime, timedelta
+from itertools import count, islice
+
+import click
+
+from bulk import CHUNK_SIZE, import_chunk, insert_rows, reset_id_sequence
+from cache import page_cache
+from counters import refresh_show_counters
+from flask_app import app
+from forms import VenueForm
+from genres import genre_lookup
+from models import Artist, Genre, Show, Venue, artist_genres_table, db, venue_genres_table
+
+SHOWS_PER_VENUE = 20
+SHOWS_PER_ARTIST = 10
+GENRES = [name for name, _ in VenueForm.genres.kwargs['choices']]
+CITIES = [
+    ('New York', 'NY', 40.71, -74.01), ('Brooklyn', 'NY', 40.68, -73.94), ('Los Angeles', 'CA', 34.05, -118.24),
+    ('San Francisco', 'CA', 37.77, -122.42), ('Oakland', 'CA', 37.80, -122.27), ('Chicago', 'IL', 41.88, -87.63),
+    ('Houston', 'TX', 29.76, -95.37), ('Austin', 'TX', 30.27, -97.74), ('Dallas', 'TX', 32.78, -96.80),
+    ('Phoenix', 'AZ', 33.45, -112.07), ('Philadelphia', 'PA', 39.95, -75.17), ('Pittsburgh', 'PA', 40.44, -80.00),
+    ('San Diego', 'CA', 32.72, -117.16), ('Seattle', 'WA', 47.61, -122.33), ('Portland', 'OR', 45.52, -122.68),
+    ('Denver', 'CO', 39.74, -104.99), ('Boston', 'MA', 42.36, -71.06), ('Nashville', 'TN', 36.16, -86.78),
+    ('Memphis', 'TN', 35.15, -90.05), ('New Orleans', 'LA', 29.95, -90.07), ('Atlanta', 'GA', 33.75, -84.39),
+    ('Miami', 'FL', 25.76, -80.19), ('Detroit', 'MI', 42.33, -83.05), ('Minneapolis', 'MN', 44.98, -93.27),
+    ('Kansas City', 'MO', 39.10, -94.58), ('St. Louis', 'MO', 38.63, -90.20), ('Las Vegas', 'NV', 36.17, -115.14),
+    ('Salt Lake City', 'UT', 40.76, -111.89), ('Baltimore', 'MD', 39.29, -76.61), ('Washington', 'DC', 38.91, -77.04),
+]
+ADJECTIVES = ['Blue', 'Velvet', 'Golden', 'Electric', 'Silver', 'Midnight', 'Crimson', 'Wild', 'Neon', 'Lucky',
+              'Black', 'Rusty', 'Hollow', 'Broken', 'Little', 'Grand', 'Lonesome', 'Savage', 'Quiet', 'Northern']
+NOUNS = ['Room', 'Owl', 'Lantern', 'Tiger', 'Harbor', 'Engine', 'Garden', 'Moon', 'Crow', 'River',
+         'Anchor', 'Fox', 'Horizon', 'Rose', 'Echo', 'Wolf', 'Bridge', 'Parlor', 'Orchard', 'Comet']
+VENUE_KINDS = ['Hall', 'Lounge', 'Club', 'Theatre', 'Bar', 'Ballroom', 'Tavern', 'Saloon', 'Warehouse', 'Stage']
+FIRST_NAMES = ['Ada', 'Ben', 'Cleo', 'Dev', 'Etta', 'Finn', 'Gus', 'Hana', 'Ike', 'June',
+               'Kai', 'Lena', 'Milo', 'Nina', 'Otis', 'Pia', 'Ray', 'Sofia', 'Theo', 'Uma']
+LAST_NAMES = ['Adams', 'Baker', 'Cruz', 'Diaz', 'Ellis', 'Foster', 'Garcia', 'Hayes', 'Ito', 'James',
+              'Kim', 'Lopez', 'Moreno', 'Nguyen', 'Okafor', 'Park', 'Reyes', 'Silva', 'Tran', 'Walker']
+STREETS = ['Main St', 'Broadway', 'Market St', 'Mission St', 'Elm St', 'Oak Ave', '2nd Ave', 'Sunset Blvd']
+
+
+def _skewed_ids(rng, num_ids, k):
+    """`k` ids between 1 and `num_ids`, the first ids being picked far more often than the last ones."""
+    cum_weights = []
+    total = 0
+    for rank in range(1, num_ids + 1):
+        total += 1 / rank ** 0.8
+        cum_weights.append(total)
+    return rng.choices(range(1, num_ids + 1), cum_weights=cum_weights, k=k)
+
+
+def _contact(rng, slug):
+    return {
+        'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04}',
+        'website': f'https://www.{slug}.com',
+        'facebook_link': f'https://www.facebook.com/{slug}',
+        'image_link': f'https://images.example.com/{slug}.jpg',
+    }
+
+
+def generate_venues(rng, num_venues):
+    for id in range(1, num_venues + 1):
+        name = f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.choice(VENUE_KINDS)}'
+        city, state, latitude, longitude = rng.choice(CITIES)
+        seeking_talent = rng.random() < 0.3
+        yield {
+            'id': id,
+            'name': name,
+            'address': f'{rng.randint(1, 2000)} {rng.choice(STREETS)}',
+            'city': city,
+            'state': state,
+            # Within about 10 km of the city center.
+            'latitude': round(latitude + rng.uniform(-0.1, 0.1), 6),
+            'longitude': round(longitude + rng.uniform(-0.1, 0.1), 6),
+            'seeking_talent': seeking_talent,
+            'seeking_description': 'We are looking for local acts to play weekends.' if seeking_talent else None,
+            'genres': rng.sample(GENRES, rng.randint(1, 4)),
+            **_contact(rng, f'venue{id}'),
+        }
+
+
+def generate_artists(rng, num_artists):
+    for id in range(1, num_artists + 1):
+        if rng.random() < 0.5:
+            name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        else:
+            name = f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}s'
+        city, state, _, _ = rng.choice(CITIES)
+        seeking_venue = rng.random() < 0.5
+        yield {
+            'id': id,
+            'name': name,
+            'city': city,
+            'state': state,
+            'seeking_venue': seeking_venue,
+            'seeking_description': 'Looking for shows in the area.' if seeking_venue else None,
+            'genres': rng.sample(GENRES, rng.randint(1, 3)),
+            **_contact(rng, f'artist{id}'),
+        }
+
+
+def generate_shows(rng, num_shows, num_venues, num_artists, now):
+    venue_ids = _skewed_ids(rng, num_venues, num_shows)
+    artist_ids = _skewed_ids(rng, num_artists, num_shows)
+    for id, venue_id, artist_id in zip(range(1, num_shows + 1), venue_ids, artist_ids):
+        day = now.date() + timedelta(days=rng.randint(-730, 365))
+        yield {
+            'id': id,
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': datetime(day.year, day.month, day.day, rng.choice((19, 20, 21, 22)), rng.choice((0, 30))),
+        }
+
+
+def _import(entity, records, chunk_size):
+    next_id = count(1)
+    for chunk in iter(lambda: list(islice(records, chunk_size)), []):
+        import_chunk(entity, chunk, next_id)
+
+
+def seed_database(num_shows, random_seed=0, chunk_size=CHUNK_SIZE):
+    """Replaces the database contents with `num_shows` generated shows and their venues, artists and genres.
+
+    The same `random_seed` always generates the same data.
+    """
+    rng = random.Random(random_seed)
+    num_venues = max(1, num_shows // SHOWS_PER_VENUE)
+    num_artists = max(1, num_shows // SHOWS_PER_ARTIST)
+    for table in (Show.__table__, venue_genres_table, artist_genres_table, Venue.__table__, Artist.__table__,
+                  Genre.__table__):
+        db.session.execute(table.delete())
+    db.session.commit()
+    genre_lookup.invalidate()
+    _import('venues', generate_venues(rng, num_venues), chunk_size)
+    _import('artists', generate_artists(rng, num_artists), chunk_size)
+    # Insert the shows without their counters: one full recount at the end is much cheaper than one per chunk.
+    shows = generate_shows(rng, num_shows, num_venues, num_artists, datetime.now())
+    for chunk in iter(lambda: list(islice(shows, chunk_size)), []):
+        insert_rows(Show.__table__, chunk)
+    refresh_show_counters(db.session.connection())
+    db.session.commit()
+    for model in (Venue, Artist, Show):
+        reset_id_sequence(model.__table__)
+    page_cache.clear()
+    return num_venues, num_artists
+
+
+@app.cli.command('seed')
+@click.option('--shows', 'num_shows', default=10000, show_default=True, help='Number of shows to generate.')
+@click.option('--seed', 'random_seed', default=0, show_default=True, help='Seed of the random generator.')
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True, help='Rows inserted per statement.')
+@click.confirmation_option(prompt='This deletes every venue, artist, show and genre. Continue?')
+def seed_command(num_shows, random_seed, chunk_size):
+    """Replaces the database contents with generated venues, artists and shows."""
+    num_venues, num_artists = seed_database(num_shows, random_seed, chunk_size)
+    click.echo(f'{num_venues} venues, {num_artists} artists, {num_shows} shows')
@@ -0,0 +1,17 @@
+from flask import Response, current_app, stream_with_context
+
+# Rows fetched from the database cursor at a time, and template fragments sent to the client at a time.
+STREAM_BATCH_SIZE = 1000
+STREAM_BUFFER_SIZE = 20
+
+
+def stream_template(template_name, **context):
+    """Like render_template, but sends the page as it is rendered.
+
+    Pass generators in `context` (for instance over `Query.yield_per`) to also fetch and serialize the rows as the
+    template reaches them: the time to first byte and the memory used then stay the same whatever the page size.
+    """
+    current_app.update_template_context(context)
+    stream = current_app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return Response(stream_with_context(stream))
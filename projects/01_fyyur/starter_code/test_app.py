@@ -0,0 +1,897 @@
+import json
+import random
+import re
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+
+from benchmark import app, count_queries, record_queries, seed
+from cache import FileCache, LRUCache, page_cache, revision_key, venue_key
+from flask_app import postgres_engine_options
+from genres import genre_lookup
+from geo import distance_km, encode
+import instrumentation
+import app as fyyur  # noqa: F401 (registers the routes)
+from jobs import JobQueue, QueueFull, job_queue
+from models import Artist, Genre, Show, Venue, artist_genres_table, db, venue_genres_table
+from queries import venue_directory
+from search import find_venues
+from seeding import seed_database
+
+# Run background jobs as they are enqueued, so that the tests see their effects right away.
+job_queue.synchronous = True
+
+
+class QueryCountTestCase(unittest.TestCase):
+    """Pages must render with a fixed number of queries, no matter how many shows they display."""
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def queries_for(self, url, num_venues, shows_per_venue):
+        seed(num_venues, shows_per_venue=shows_per_venue)
+        with count_queries() as counter:
+            result = self.client.get(url)
+        self.assertEqual(result.status_code, 200)
+        return counter[0]
+
+    def assertConstantQueries(self, url):
+        self.assertEqual(self.queries_for(url, num_venues=2, shows_per_venue=2),
+                         self.queries_for(url, num_venues=20, shows_per_venue=20))
+
+    def test_venues_query_count_is_constant(self):
+        self.assertConstantQueries('/venues')
+
+    def test_shows_query_count_is_constant(self):
+        self.assertConstantQueries('/shows')
+
+    def test_show_venue_query_count_is_constant(self):
+        self.assertConstantQueries('/venues/1')
+
+    def test_show_artist_query_count_is_constant(self):
+        self.assertConstantQueries('/artists/1')
+
+
+class ShowPartitionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        seed(1, shows_per_venue=5)
+
+    def test_show_venue_splits_past_and_upcoming_shows(self):
+        result = self.client.get('/venues/1')
+        self.assertIn(b'2 Upcoming Shows', result.data)
+        self.assertIn(b'3 Past Shows', result.data)
+
+    def test_show_artist_splits_past_and_upcoming_shows(self):
+        result = self.client.get('/artists/1')
+        self.assertIn(b'2 Upcoming Shows', result.data)
+        self.assertIn(b'3 Past Shows', result.data)
+
+
+class SearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        seed(30)
+
+    def test_search_ranks_exact_name_first(self):
+        with app.app_context():
+            results = find_venues('venue 1')
+        self.assertEqual(results['count'], 11)
+        self.assertEqual(results['data'][0], {'id': 1, 'name': 'Venue 1', 'num_upcoming_shows': 1})
+
+    def test_search_paginates(self):
+        with app.app_context():
+            results = find_venues('venue 1', page=3, per_page=5)
+        self.assertEqual(results['count'], 11)
+        self.assertEqual(len(results['data']), 1)
+
+    def test_search_matches_city_and_genre(self):
+        with app.app_context():
+            venue = Venue.query.get(2)
+            venue.genres = [Genre(name='Jazz')]
+            db.session.commit()
+            self.assertEqual([venue['id'] for venue in find_venues('jazz')['data']], [2])
+            self.assertEqual(find_venues('City 3')['count'], 2)
+
+    def test_search_counts_rows_matching_name_and_genre_once(self):
+        with app.app_context():
+            venue = Venue.query.get(3)
+            venue.genres = [Genre(name='Venue music')]
+            db.session.commit()
+            self.assertEqual(find_venues('Venue 3')['count'], 2)
+
+    def test_search_pages_start_at_one(self):
+        with app.app_context():
+            self.assertEqual(find_venues('venue 1', page=0), find_venues('venue 1', page=1))
+        self.assertEqual(self.client.post('/venues/search', data={'search_term': 'Venue', 'page': -2}).status_code,
+                         200)
+
+    def test_search_escapes_wildcards(self):
+        with app.app_context():
+            self.assertEqual(find_venues('%')['count'], 0)
+
+    def test_search_venues_page(self):
+        result = self.client.post('/venues/search', data={'search_term': 'Venue 3'})
+        self.assertIn(b'Number of search results for "Venue 3": 2', result.data)
+
+
+class PaginationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        seed(60)
+
+    def walk(self, url, marker):
+        """Follows the "Next page" links from `url` and returns the number of pages and of `marker` occurrences."""
+        pages = found = 0
+        while url:
+            result = self.client.get(url)
+            self.assertEqual(result.status_code, 200)
+            pages += 1
+            found += result.data.count(marker)
+            next_link = re.search(rb'<a href="([^"]+)">Next page</a>', result.data)
+            url = next_link.group(1).decode() if next_link else None
+        return pages, found
+
+    def test_venues_pages_cover_every_venue(self):
+        self.assertEqual(self.walk('/venues', b'<a href="/venues/'), (2, 60))
+
+    def test_artists_pages_cover_every_artist(self):
+        self.assertEqual(self.walk('/artists', b'<a href="/artists/'), (2, 60))
+
+    def test_shows_pages_cover_every_show(self):
+        self.assertEqual(self.walk('/shows', b'tile-show'), (3, 120))
+
+    def test_streamed_venues_list_every_venue(self):
+        result = self.client.get('/venues?stream')
+        self.assertTrue(result.is_streamed)
+        self.assertEqual(result.data.count(b'<a href="/venues/'), 60)
+        self.assertNotIn(b'Next page', result.data)
+
+    def test_streamed_shows_list_every_show(self):
+        result = self.client.get('/shows?stream')
+        self.assertTrue(result.is_streamed)
+        self.assertEqual(result.data.count(b'tile-show'), 120)
+
+    def test_malformed_cursor_is_a_bad_request(self):
+        self.assertEqual(self.client.get('/shows?after=nonsense').status_code, 400)
+        for url, values in [('/artists', [{'a': 1}]), ('/artists', ['1']), ('/artists', [True]),
+                            ('/venues', [None, None, 1]), ('/venues', ['CA', ['City 1'], 1]),
+                            ('/venues', {'a': 'CA', 'b': 'City 1', 'c': 1}), ('/shows', ['2030-01-01T20:00:00', 1.5]),
+                            ('/api/v1/venues', [[1]])]:
+            with self.subTest(url=url, values=values):
+                cursor = urlsafe_b64encode(json.dumps(values).encode()).decode()
+                self.assertEqual(self.client.get(f'{url}?after={cursor}').status_code, 400)
+
+    def test_venues_without_city_or_state_are_listed(self):
+        seed(20)
+        # The fourth page of 3 venues ends on venue 3, the last of the NY venues without a city.
+        Venue.query.filter(Venue.id.in_([1, 2, 3])).update({'city': None}, synchronize_session=False)
+        Venue.query.filter(Venue.id == 4).update({'state': None}, synchronize_session=False)
+        db.session.commit()
+        venue_ids = []
+        cursor = None
+        while True:
+            areas, cursor = venue_directory(cursor, per_page=3)
+            venue_ids += [venue['id'] for area in areas for venue in area['venues']]
+            if cursor is None:
+                break
+        self.assertEqual(sorted(venue_ids), list(range(1, 21)))
+
+
+def _split_terms(terms):
+    """The comma separated terms of an ORDER BY or index column list, leaving the commas within parentheses."""
+    return [term.strip() for term in re.split(r',(?![^()]*\))', terms)]
+
+
+def _column_name(term):
+    """A column or expression without its table name, quotes and ASC."""
+    return re.sub(r'"?\w+"?\.', '', term).replace('"', '').replace(' ASC', '').strip()
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """The queries of every route must read the large tables through an index, never by a full sequential scan."""
+
+    NUM_VENUES = 2000
+    # Scanning a table with fewer rows than this is cheaper than going through an index, so it is not a regression.
+    ROW_THRESHOLD = 500
+    URLS = ['/venues', '/shows', '/artists', '/venues/1', '/artists/1']
+    POSTGRES_URLS = [('/venues/search', 'Venue 42'), ('/artists/search', 'Artist 42')]
+
+    @classmethod
+    def setUpClass(cls):
+        seed(cls.NUM_VENUES)
+        db.session.bulk_insert_mappings(Genre, [{'id': i, 'name': f'Genre {i}'} for i in range(1, 11)])
+        for table, key in ((venue_genres_table, 'venue_id'), (artist_genres_table, 'artist_id')):
+            db.session.execute(table.insert(), [{key: i, 'genre_id': i % 10 + 1}
+                                                for i in range(1, cls.NUM_VENUES + 1)])
+        db.session.commit()
+        table_names = [table.name for table in db.metadata.sorted_tables]
+        cls.large_tables = {name for name in table_names
+                            if db.session.execute(f'SELECT count(*) FROM "{name}"').scalar() > cls.ROW_THRESHOLD}
+        db.session.remove()
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def selects(self, method, url, **kwargs):
+        with record_queries() as statements:
+            result = self.client.open(url, method=method, **kwargs)
+        self.assertEqual(result.status_code, 200)
+        return [(statement, parameters) for statement, parameters in statements
+                if statement.lstrip().upper().startswith('SELECT')]
+
+    def explain(self, statement, parameters):
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            if db.engine.dialect.name == 'postgresql':
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+                return cursor.fetchone()[0][0]['Plan']
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            return [row[-1] for row in cursor.fetchall()]
+        finally:
+            connection.close()
+
+    def sequential_scans(self, statement, parameters):
+        """The large tables that `statement` reads entirely, according to the database's query plan."""
+        plan = self.explain(statement, parameters)
+        if db.engine.dialect.name == 'postgresql':
+            nodes, scanned = [plan], set()
+            while nodes:
+                node = nodes.pop()
+                if node['Node Type'] == 'Seq Scan':
+                    scanned.add(node['Relation Name'])
+                nodes.extend(node.get('Plans', []))
+            return scanned & self.large_tables
+        scanned = set()
+        for step in plan:
+            match = re.match(r'SCAN (?:TABLE )?(\w+?)(?:_\d+)?\b(?: USING (?:COVERING )?INDEX (\w+))?', step)
+            if match and not self.reads_one_page(statement, plan, match.group(2)):
+                scanned.add(match.group(1))
+        return scanned & self.large_tables
+
+    def reads_one_page(self, statement, plan, index):
+        """Whether a SQLite SCAN through `index`, or through the rowids when None, stops after a page of rows: SCANs
+        read the whole table, except when it is not filtered, the index gives the order of the ORDER BY and the
+        statement has a LIMIT."""
+        statement = ' '.join(statement.split())
+        if ' WHERE ' in statement or ' LIMIT ' not in statement or any('TEMP B-TREE' in step for step in plan):
+            return False
+        order_by = re.search(r' ORDER BY (.+?) LIMIT ', statement)
+        if order_by is None:
+            return False
+        terms = []
+        for term in _split_terms(order_by.group(1)):
+            # Labels stand for the expression they name in the select list.
+            labelled = re.search(rf'(\w+\([^()]*\)|[\w".]+) AS {re.escape(term)}\b', statement)
+            terms.append(_column_name(labelled.group(1) if labelled else term))
+        if index is None:
+            columns = ['id']
+        else:
+            sql = db.session.execute('SELECT sql FROM sqlite_master WHERE name = :name', {'name': index}).scalar()
+            columns = [_column_name(column) for column in _split_terms(sql[sql.index('(', sql.index(' ON ')) + 1:-1])]
+        return columns[:len(terms)] == terms
+
+    def assertNoSequentialScans(self, method, url, **kwargs):
+        for statement, parameters in self.selects(method, url, **kwargs):
+            with self.subTest(url=url, statement=' '.join(statement.split())[:200]):
+                self.assertEqual(self.sequential_scans(statement, parameters), set())
+
+    def test_listings_use_indexes(self):
+        for url in self.URLS:
+            self.assertNoSequentialScans('GET', url)
+
+    def test_filtered_scans_are_found(self):
+        # Unindexed filters can read the whole table before finding a page of rows, LIMIT or not.
+        for statement, parameters in [
+                ('SELECT id FROM "Venue" WHERE phone = ? LIMIT 51', ('555-0100',)),
+                ('SELECT id FROM "Venue" WHERE phone = ? ORDER BY id LIMIT 51', ('555-0100',)),
+                ('SELECT id FROM "Artist" WHERE seeking_venue ORDER BY id LIMIT 51', ())]:
+            with self.subTest(statement=statement):
+                self.assertNotEqual(self.sequential_scans(statement, parameters), set())
+
+    def test_following_pages_use_indexes(self):
+        for url in ('/venues', '/artists', '/shows'):
+            next_link = re.search(rb'<a href="([^"]+)">Next page</a>', self.client.get(url).data)
+            self.assertNoSequentialScans('GET', next_link.group(1).decode())
+
+    def test_search_uses_trigram_indexes(self):
+        if db.engine.dialect.name != 'postgresql':
+            self.skipTest('substring searches can only use an index with the pg_trgm indexes of Postgres')
+        for url, search_term in self.POSTGRES_URLS:
+            self.assertNoSequentialScans('POST', url, data={'search_term': search_term})
+
+
+class CacheTestCase(unittest.TestCase):
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_lru_cache_expires_entries(self):
+        cache = LRUCache(timeout=-1)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_file_cache_round_trips_and_deletes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = FileCache(directory)
+            cache.set('venue:1', {'start_time': datetime(2020, 1, 1)})
+            self.assertEqual(FileCache(directory).get('venue:1'), {'start_time': datetime(2020, 1, 1)})
+            cache.delete('venue:1')
+            self.assertIsNone(cache.get('venue:1'))
+
+    def test_show_venue_is_cached_until_edited(self):
+        seed(2)
+        client = app.test_client()
+        client.get('/venues/1')
+        hits = page_cache.hits
+        with count_queries() as counter:
+            client.get('/venues/1')
+        # The page and its revision.
+        self.assertEqual((counter[0], page_cache.hits), (0, hits + 2))
+
+        client.post('/venues/1/edit', data={'name': 'Renamed Venue'})
+        self.assertIn(b'Renamed Venue', client.get('/venues/1').data)
+
+    def test_shows_invalidate_their_venue_and_artist(self):
+        seed(2)
+        with app.app_context():
+            self.assertEqual(fyyur._cached_pages_showing(Show(venue_id=1, artist_id=2)), ['venue:1', 'artist:2'])
+            self.assertEqual(fyyur._cached_pages_showing(Venue.query.get(1)), ['venue:1', 'artist:1'])
+            self.assertEqual(fyyur._cached_pages_showing(Artist.query.get(2)), ['artist:2', 'venue:2'])
+
+    def test_missing_venue_is_not_found(self):
+        seed(1)
+        self.assertEqual(app.test_client().get('/venues/404').status_code, 404)
+
+
+class GenreLookupTestCase(unittest.TestCase):
+
+    def setUp(self):
+        seed(1)
+        with app.app_context():
+            db.session.add_all([Genre(name='Jazz'), Genre(name='Rock n Roll'), Genre(name='Folk')])
+            db.session.commit()
+
+    def test_edit_keeps_every_submitted_genre(self):
+        client = app.test_client()
+        client.post('/venues/1/edit', data={'name': 'Venue 1', 'genres': ['Jazz', 'Folk', 'Unknown']})
+        client.post('/artists/1/edit', data={'name': 'Artist 1', 'genres': ['Rock n Roll', 'Jazz']})
+        with app.app_context():
+            self.assertEqual(sorted(genre.name for genre in Venue.query.get(1).genres), ['Folk', 'Jazz'])
+            self.assertEqual(sorted(genre.name for genre in Artist.query.get(1).genres), ['Jazz', 'Rock n Roll'])
+
+    def test_known_genres_resolve_without_queries(self):
+        with app.app_context():
+            genre_lookup.resolve(['Jazz'])
+            with count_queries() as counter:
+                genres = genre_lookup.resolve(['Jazz', 'Folk', 'Rock n Roll'])
+            self.assertEqual(counter[0], 0)
+            self.assertEqual([genre.name for genre in genres], ['Jazz', 'Folk', 'Rock n Roll'])
+
+    def test_new_genres_are_picked_up(self):
+        with app.app_context():
+            genre_lookup.resolve(['Jazz'])
+            db.session.add(Genre(name='Blues'))
+            db.session.commit()
+            self.assertEqual([genre.name for genre in genre_lookup.resolve(['Blues'])], ['Blues'])
+
+
+class BulkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        seed(30, shows_per_venue=3)
+        with app.app_context():
+            Venue.query.get(1).genres = [Genre(name='Jazz'), Genre(name='Folk')]
+            db.session.commit()
+        self.runner = app.test_cli_runner()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def export_and_reimport(self, extension):
+        paths = {}
+        for entity in ('venues', 'artists', 'shows'):
+            paths[entity] = f'{self.directory.name}/{entity}.{extension}'
+            result = self.runner.invoke(args=['export', entity, paths[entity]])
+            self.assertEqual(result.exit_code, 0, result.output)
+        seed(0)
+        for entity in ('venues', 'artists', 'shows'):
+            result = self.runner.invoke(args=['import', entity, paths[entity], '--chunk-size', '7'])
+            self.assertEqual(result.exit_code, 0, result.output)
+        with app.app_context():
+            self.assertEqual((Venue.query.count(), Artist.query.count(), Show.query.count()), (30, 30, 90))
+            self.assertEqual(sorted(genre.name for genre in Venue.query.get(1).genres), ['Folk', 'Jazz'])
+            self.assertEqual(Venue.query.get(7).city, 'City 7')
+
+    def test_csv_round_trip(self):
+        self.export_and_reimport('csv')
+
+    def test_jsonl_round_trip(self):
+        self.export_and_reimport('jsonl')
+
+    def test_chunk_size_must_be_positive(self):
+        path = f'{self.directory.name}/shows.jsonl'
+        with open(path, 'w') as file:
+            file.write('{"venue_id": 1, "artist_id": 2, "start_time": "2030-01-01T20:00:00"}\n')
+        for chunk_size in ('0', '-1'):
+            result = self.runner.invoke(args=['import', 'shows', path, '--chunk-size', chunk_size])
+            self.assertEqual(result.exit_code, 2, result.output)
+
+    def test_import_skips_invalid_rows_and_numbers_rows_without_id(self):
+        path = f'{self.directory.name}/shows.jsonl'
+        with open(path, 'w') as file:
+            file.write('{"venue_id": 1, "artist_id": 2, "start_time": "2030-01-01T20:00:00"}\n')
+            file.write('{"venue_id": 1000, "artist_id": 2, "start_time": "2030-01-01T20:00:00"}\n')
+            file.write('{"venue_id": 1, "artist_id": 2}\n')
+            file.write('{"venue_id": "one", "artist_id": 2, "start_time": "2030-01-01T20:00:00"}\n')
+            file.write('{"venue_id": 1, "artist_id": \n')
+            file.write('[1, 2]\n')
+        result = self.runner.invoke(args=['import', 'shows', path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('1 rows, 5 skipped', result.output)
+        with app.app_context():
+            self.assertEqual(Show.query.order_by(Show.id.desc()).first().id, 91)
+
+
+class ShowCountersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        seed(2, shows_per_venue=0)
+
+    def counters(self, model, id):
+        with app.app_context():
+            entity = model.query.get(id)
+            return entity.upcoming_shows_count, entity.past_shows_count
+
+    def test_writing_shows_recounts_their_venue_and_artist(self):
+        with app.app_context():
+            show = Show(venue_id=1, artist_id=2, start_time=datetime.now() + timedelta(days=1))
+            db.session.add_all([show, Show(venue_id=1, artist_id=1, start_time=datetime.now() - timedelta(days=1))])
+            db.session.commit()
+        self.assertEqual(self.counters(Venue, 1), (1, 1))
+        self.assertEqual(self.counters(Artist, 2), (1, 0))
+
+        with app.app_context():
+            show = Show.query.filter_by(artist_id=2).one()
+            show.venue_id = 2
+            db.session.commit()
+        self.assertEqual(self.counters(Venue, 1), (0, 1))
+        self.assertEqual(self.counters(Venue, 2), (1, 0))
+
+        with app.app_context():
+            db.session.delete(Show.query.filter_by(artist_id=2).one())
+            db.session.commit()
+        self.assertEqual(self.counters(Venue, 2), (0, 0))
+        self.assertEqual(self.counters(Artist, 2), (0, 0))
+
+    def test_rollover_moves_started_shows_to_the_past(self):
+        with app.app_context():
+            db.session.add(Show(venue_id=1, artist_id=1, start_time=datetime.now() - timedelta(minutes=5)))
+            db.session.commit()
+            # As if the show had been counted before it started.
+            Venue.query.filter_by(id=1).update({'upcoming_shows_count': 1, 'past_shows_count': 0})
+            db.session.commit()
+        result = app.test_cli_runner().invoke(args=['rollover-shows', '--window', '10'])
+        self.assertEqual(result.output, 'Recounted 1 venues and 1 artists\n')
+        self.assertEqual(self.counters(Venue, 1), (0, 1))
+
+
+class SeedingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        seed(1)
+
+    def test_generates_consistent_data(self):
+        self.assertEqual(seed_database(200), (10, 20))
+        self.assertEqual(Show.query.count(), 200)
+        self.assertGreater(db.session.query(venue_genres_table).count(), 0)
+        self.assertEqual(db.session.query(db.func.sum(Venue.upcoming_shows_count + Venue.past_shows_count)).scalar(),
+                         200)
+
+    def test_seed_command_asks_for_confirmation(self):
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['seed', '--shows', '20'], input='n\n')
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertEqual(Show.query.count(), 2)
+        result = runner.invoke(args=['seed', '--shows', '20', '--yes'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(Show.query.count(), 20)
+
+    def test_same_seed_generates_same_data(self):
+        seed_database(100, random_seed=7)
+        first = db.session.query(Venue.name, Venue.city, Venue.upcoming_shows_count).order_by(Venue.id).all()
+        seed_database(100, random_seed=7)
+        self.assertEqual(first,
+                         db.session.query(Venue.name, Venue.city, Venue.upcoming_shows_count).order_by(Venue.id).all())
+
+
+class InstrumentationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        seed(5)
+
+    def tearDown(self):
+        app.config.update(SLOW_QUERY_MS=200, N_PLUS_ONE_THRESHOLD=10)
+
+    def test_server_timing_reports_statements(self):
+        with count_queries() as counter:
+            result = self.client.get('/venues/1')
+        timings = result.headers.getlist('Server-Timing')
+        self.assertEqual(len(timings), 2)
+        self.assertRegex(timings[0], rf'^db;dur=[\d.]+;desc="{counter[0]} queries"$')
+        self.assertRegex(timings[1], r'^app;dur=[\d.]+$')
+
+    def test_slow_queries_are_logged_with_parameters(self):
+        app.config['SLOW_QUERY_MS'] = 0
+        with self.assertLogs(instrumentation.logger, 'WARNING') as logs:
+            self.client.get('/venues/3')
+        self.assertTrue(any('Slow query' in line and 'Parameters: (3,)' in line for line in logs.output))
+
+    def test_repeated_statements_are_reported(self):
+        app.config['N_PLUS_ONE_THRESHOLD'] = 3
+        with app.test_request_context('/venues'), self.assertLogs(instrumentation.logger, 'WARNING') as logs:
+            app.preprocess_request()
+            for venue in Venue.query.all():
+                venue.genres
+            app.process_response(app.response_class())
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Possible N+1 query on GET /venues: statement run 5 times', logs.output[0])
+
+    def test_failed_statements_are_not_left_timing(self):
+        with app.app_context():
+            connection = db.engine.connect()
+            with self.assertRaises(OperationalError):
+                connection.execute('SELECT * FROM no_such_table')
+            self.assertEqual(connection.info.get('query_started_at'), [])
+            connection.close()
+
+    def test_in_lists_share_a_shape(self):
+        self.assertEqual(instrumentation.statement_shape('SELECT 1 WHERE id IN (?, ?)'),
+                         instrumentation.statement_shape('SELECT 1\n WHERE id IN (?, ?, ?)'))
+
+
+class EngineOptionsTestCase(unittest.TestCase):
+
+    def test_pool_settings(self):
+        config = {**app.config, 'DATABASE_POOL_SIZE': 3, 'DATABASE_STATEMENT_TIMEOUT_MS': 5000}
+        options = postgres_engine_options(config)
+        self.assertEqual(options['pool_size'], 3)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=5000'})
+
+    def test_pgbouncer_mode_leaves_pooling_to_pgbouncer(self):
+        config = {**app.config, 'DATABASE_PGBOUNCER': True, 'DATABASE_STATEMENT_TIMEOUT_MS': 5000}
+        self.assertEqual(postgres_engine_options(config), {'poolclass': NullPool})
+
+
+class ReplicaTestCase(unittest.TestCase):
+    """Runs against a second in-memory database standing in for the replica, with different data."""
+
+    def setUp(self):
+        self.client = app.test_client()
+        seed(2)
+        app.config['SQLALCHEMY_BINDS'] = {'replica': 'sqlite://'}
+        self.replica = db.get_engine(app, bind='replica')
+        db.metadata.create_all(self.replica)
+        self.replica.execute(Venue.__table__.insert(), {'id': 1, 'name': 'Replica venue', 'city': 'Boston'})
+
+    def tearDown(self):
+        self.replica.dispose()
+        app.extensions['sqlalchemy'].connectors.pop('replica')
+        app.config['SQLALCHEMY_BINDS'] = None
+        page_cache.clear()
+
+    def test_reads_go_to_the_replica(self):
+        self.assertIn(b'Replica venue', self.client.get('/venues/1').data)
+        result = self.client.post('/venues/search', data={'search_term': 'Venue'})
+        self.assertIn(b'Replica venue', result.data)
+        self.assertNotIn(b'Venue 2', result.data)
+
+    def test_writes_go_to_the_primary_and_the_writer_reads_them(self):
+        result = self.client.post('/venues/2/edit', data={'name': 'Renamed venue', 'city': 'Austin', 'state': 'TX',
+                                                          'address': '1 Main St', 'genres': []})
+        self.assertEqual(result.status_code, 302)
+        self.assertEqual(Venue.query.get(2).name, 'Renamed venue')
+        self.assertIn(b'Renamed venue', self.client.get('/venues/2').data)
+        # Once the stickiness expires, reads go back to the replica, where venue 2 does not exist.
+        self.client.cookie_jar.clear()
+        page_cache.clear()
+        self.assertEqual(self.client.get('/venues/2').status_code, 404)
+
+    def test_pages_read_from_the_replica_are_not_cached(self):
+        result = self.client.post('/venues/1/edit', data={'name': 'Renamed venue', 'city': 'Austin', 'state': 'TX',
+                                                          'address': '1 Main St', 'genres': []})
+        self.assertEqual(result.status_code, 302)
+        # Another client reads the page as the lagging replica has it, right after the write.
+        self.assertIn(b'Replica venue', app.test_client().get('/venues/1').data)
+        self.assertIsNone(page_cache.backend.get(venue_key(1)))
+        self.assertIsNone(page_cache.backend.get(revision_key(venue_key(1))))
+        self.assertIn(b'Renamed venue', self.client.get('/venues/1').data)
+
+
+class ApiTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        seed(3)
+
+    def test_sparse_fields(self):
+        result = self.client.get('/api/v1/venues?fields=name,genres')
+        self.assertEqual(result.get_json()['data'][0], {'name': 'Venue 1', 'genres': []})
+        self.assertEqual(self.client.get('/api/v1/venues?fields=password').status_code, 400)
+
+    def test_embedded_shows(self):
+        artist = self.client.get('/api/v1/artists/2?fields=id&embed=shows').get_json()
+        self.assertEqual(len(artist['past_shows']), 1)
+        self.assertEqual(artist['upcoming_shows'][0]['venue_name'], 'Venue 2')
+        self.assertNotIn('upcoming_shows', self.client.get('/api/v1/artists/2').get_json())
+
+    def test_embedding_shows_in_lists_costs_one_query(self):
+        with count_queries() as counter:
+            self.client.get('/api/v1/venues?fields=id&embed=shows')
+        self.assertEqual(counter[0], 2)
+
+    def test_unchanged_resources_are_not_sent_again(self):
+        result = self.client.get('/api/v1/venues/1')
+        self.assertEqual(self.client.get('/api/v1/venues/1', headers={'If-None-Match': result.headers['ETag']})
+                         .status_code, 304)
+
+    def test_missing_resource(self):
+        self.assertEqual(self.client.get('/api/v1/artists/42').get_json(), {'error': 'No artist with id 42'})
+
+
+class GeoTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        seed(2)
+        rng = random.Random(0)
+        db.session.add_all(Venue(name=f'Geo venue {i}', city='New York', state='NY',
+                                 latitude=40.71 + rng.uniform(-0.5, 0.5), longitude=-74.01 + rng.uniform(-0.5, 0.5))
+                           for i in range(200))
+        db.session.commit()
+
+    def nearest(self, latitude, longitude, k):
+        result = self.client.get(f'/api/v1/venues/near?lat={latitude}&lon={longitude}&k={k}')
+        self.assertEqual(result.status_code, 200)
+        return result.get_json()['data']
+
+    def test_geohash_follows_coordinates(self):
+        venue = Venue.query.get(1)
+        self.assertIsNone(venue.geohash)
+        venue.latitude, venue.longitude = 48.8584, 2.2945
+        db.session.commit()
+        self.assertEqual(venue.geohash, encode(48.8584, 2.2945))
+        self.assertTrue(venue.geohash.startswith('u09tunq'))
+
+    def test_nearest_venues_match_a_full_scan(self):
+        for latitude, longitude, k in [(40.71, -74.01, 5), (40.2, -73.5, 10), (42.36, -71.06, 3)]:
+            expected = sorted(Venue.query.filter(Venue.latitude.isnot(None)),
+                              key=lambda venue: distance_km(latitude, longitude, venue.latitude, venue.longitude))[:k]
+            self.assertEqual([venue['id'] for venue in self.nearest(latitude, longitude, k)],
+                             [venue.id for venue in expected])
+
+    def test_nearest_venues_count_upcoming_shows(self):
+        venue = Venue.query.get(2)
+        venue.latitude, venue.longitude = 40.71, -74.01
+        db.session.commit()
+        nearest = self.nearest(40.71, -74.01, 1)[0]
+        self.assertEqual((nearest['id'], nearest['distance_km'], nearest['upcoming_shows_count']), (2, 0, 1))
+
+    def test_venues_without_coordinates_are_left_out(self):
+        self.assertEqual(len(self.nearest(40.71, -74.01, 100)), 100)
+        self.assertNotIn(1, [venue['id'] for venue in self.nearest(0, 0, 100)])
+
+    def test_invalid_parameters(self):
+        for query in ['lat=40.71', 'lat=91&lon=0', 'lat=north&lon=0', 'lat=0&lon=0&k=0', 'lat=0&lon=0&k=1000']:
+            self.assertEqual(self.client.get(f'/api/v1/venues/near?{query}').status_code, 400, query)
+
+
+class ConditionalGetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        seed(3)
+
+    def etag(self, url):
+        result = self.client.get(url)
+        self.assertEqual(result.status_code, 200)
+        self.assertTrue(result.cache_control.no_cache)
+        return result.headers['ETag']
+
+    def test_server_default_update_time_is_utc(self):
+        db.session.execute(Venue.__table__.insert().values(id=100, name='Raw venue'))
+        updated_at = db.session.query(Venue.updated_at).filter_by(id=100).scalar()
+        self.assertLess(abs(updated_at - datetime.utcnow()), timedelta(minutes=1))
+        db.session.rollback()
+        # As in the migration that added the column.
+        self.assertEqual(str(Venue.__table__.c.updated_at.server_default.arg.compile(dialect=postgresql.dialect())),
+                         "timezone('utc', now())")
+
+    def test_unchanged_pages_are_not_rendered_again(self):
+        for url in ('/venues', '/shows', '/venues/1', '/artists/1'):
+            etag = self.etag(url)
+            with count_queries() as counter:
+                result = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual((result.status_code, result.data), (304, b''))
+            self.assertLessEqual(counter[0], 1)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get('/venues/1').headers['Last-Modified']
+        self.assertEqual(self.client.get('/venues/1', headers={'If-Modified-Since': last_modified}).status_code, 304)
+
+    def test_lists_ignore_if_modified_since(self):
+        # Deleting a row does not move the latest update time of a list, so only the ETag can tell it changed.
+        for url in ('/venues', '/shows'):
+            result = self.client.get(url)
+            self.assertNotIn('Last-Modified', result.headers)
+            since = 'Thu, 01 Jan 2099 00:00:00 GMT'
+            self.assertEqual(self.client.get(url, headers={'If-Modified-Since': since}).status_code, 200)
+
+    def test_edits_change_the_etag_of_the_pages_showing_them(self):
+        venue_page, shows_page = self.etag('/venues/1'), self.etag('/shows')
+        self.client.post('/artists/1/edit', data={'name': 'Renamed artist'})
+        self.assertNotEqual(self.etag('/venues/1'), venue_page)
+        self.assertNotEqual(self.etag('/shows'), shows_page)
+
+    def test_genre_only_edits_change_the_etag(self):
+        with app.app_context():
+            db.session.add(Genre(name='Jazz'))
+            db.session.commit()
+        etag = self.etag('/venues/2')
+        self.client.post('/venues/2/edit', data={'genres': ['Jazz']})
+        self.assertNotEqual(self.etag('/venues/2'), etag)
+
+    def test_new_and_deleted_rows_change_the_etag_of_lists(self):
+        venues_page, shows_page = self.etag('/venues'), self.etag('/shows')
+        with app.app_context():
+            db.session.add(Venue(name='New venue', city='Austin', state='TX'))
+            Show.query.filter_by(id=1).delete()
+            db.session.commit()
+        self.assertNotEqual(self.etag('/venues'), venues_page)
+        self.assertNotEqual(self.etag('/shows'), shows_page)
+
+
+class JobQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = f'{self.directory.name}/jobs.sqlite3'
+        self.done = []
+        self.queues = []
+
+    def tearDown(self):
+        for queue in self.queues:
+            queue.stop()
+        self.directory.cleanup()
+
+    def queue(self, **options):
+        queue = JobQueue(self.path, retry_delay=0.01, enqueue_timeout=0.05, **options)
+        self.queues.append(queue)
+
+        @queue.task
+        def record(value):
+            self.done.append(value)
+
+        @queue.task
+        def flaky(value):
+            self.done.append(value)
+            if len(self.done) < 3:
+                raise ValueError('not yet')
+
+        return queue
+
+    def test_jobs_run_in_the_background(self):
+        queue = self.queue()
+        queue.enqueue('record', 1)
+        queue.enqueue('record', 2)
+        self.assertTrue(queue.wait_until_idle())
+        self.assertEqual(sorted(self.done), [1, 2])
+        self.assertEqual(queue.stats()['succeeded'], 2)
+
+    def test_failing_jobs_are_retried(self):
+        queue = self.queue(max_attempts=3)
+        queue.enqueue('flaky', 'x')
+        self.assertTrue(queue.wait_until_idle())
+        self.assertEqual(self.done, ['x', 'x', 'x'])
+        self.assertEqual((queue.stats()['retried'], queue.stats()['succeeded']), (2, 1))
+
+    def test_jobs_are_given_up_after_max_attempts(self):
+        queue = self.queue(max_attempts=2)
+        queue.enqueue('flaky', 'x')
+        self.assertTrue(queue.wait_until_idle())
+        self.assertEqual(self.done, ['x', 'x'])
+        self.assertEqual(queue.stats()['failed_in_queue'], 1)
+
+    def test_full_queue_pushes_back(self):
+        queue = self.queue(workers=0, max_pending=2)
+        queue.enqueue('record', 1)
+        queue.enqueue('record', 2)
+        with self.assertRaises(QueueFull):
+            queue.enqueue('record', 3)
+        queue.enqueue_or_run('record', 4)
+        self.assertEqual(self.done, [4])
+        self.assertEqual(queue.stats()['rejected'], 2)
+
+    def test_enqueue_errors_run_the_job(self):
+        queue = self.queue(workers=0)
+        queue.path = self.directory.name
+        queue.enqueue_or_run('record', 1)
+        self.assertEqual(self.done, [1])
+
+    def test_workers_survive_queue_errors(self):
+        queue = self.queue(workers=1)
+        claim = queue._claim
+        failures = [sqlite3.OperationalError('database is locked')]
+
+        def failing_claim():
+            if failures:
+                raise failures.pop()
+            return claim()
+
+        queue._claim = failing_claim
+        queue.enqueue('record', 1)
+        self.assertTrue(queue.wait_until_idle())
+        self.assertEqual((self.done, failures), ([1], []))
+
+    def test_local_jobs_only_run_in_their_process(self):
+        queue = self.queue(workers=0)
+        queue.task(local=True)(queue.tasks['record'])
+        queue.enqueue('record', 1)
+        queue._connection().execute('UPDATE jobs SET owner = owner + 1')
+        self.assertEqual(queue.work_once(), (False, None))
+        queue._connection().execute('UPDATE jobs SET owner = NULL')
+        self.assertEqual(queue.work_once(), (True, None))
+        self.assertEqual(self.done, [1])
+
+    def test_workers_start_with_the_app(self):
+        self.queue(workers=0).enqueue('record', 1)
+        queue = self.queue()
+        with mock.patch('jobs.job_queue', queue):
+            app._got_first_request = False
+            app.test_client().get('/')
+        self.assertTrue(queue.wait_until_idle())
+        self.assertEqual(self.done, [1])
+
+    def test_queued_jobs_survive_a_restart(self):
+        self.queue(workers=0).enqueue('record', 1)
+        queue = self.queue()
+        queue.start()
+        self.assertTrue(queue.wait_until_idle())
+        self.assertEqual(self.done, [1])
+
+
+class FormatDatetimeTestCase(unittest.TestCase):
+
+    def test_formats_datetimes_and_strings_alike(self):
+        date = datetime(2020, 5, 21, 21, 30)
+        self.assertEqual(fyyur.format_datetime(date, 'full'), 'Thursday May, 21, 2020 at 5:30PM')
+        self.assertEqual(fyyur.format_datetime('2020-05-21 21:30:00', 'full'), 'Thursday May, 21, 2020 at 5:30PM')
+        self.assertEqual(fyyur.format_datetime(date), 'Thu 05, 21, 2020 5:30PM')
+
+    def test_babel_named_formats(self):
+        date = datetime(2020, 5, 21, 21, 30)
+        self.assertEqual(fyyur.format_datetime(date, 'short'), '5/21/20, 5:30 PM')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Benchmarks for the trivia API.
+
+Runs against an in-memory SQLite database unless BENCHMARK_DATABASE_URI is set. From the starter directory:
+
+    python -m backend.benchmark
+"""
+import json
+import os
+import random
+import time
+
+from backend.flaskr import create_app
+from backend.ingest import ingest_questions
+from backend.models import db, forget_cached_questions, Category, Question
+from backend.search import setup_search
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+WORDS = ['river', 'painter', 'mountain', 'novel', 'planet', 'emperor', 'guitar', 'ocean', 'desert', 'comet',
+         'cathedral', 'stadium', 'symphony', 'volcano', 'island', 'sculptor', 'marathon', 'glacier', 'opera', 'pharaoh',
+         'telescope', 'tournament', 'dynasty', 'canyon', 'element', 'poet', 'film', 'harbor', 'legend', 'voyage']
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': os.environ.get('BENCHMARK_DATABASE_URI', 'sqlite://')})
+
+
+def seed_questions(num_questions, chunk_size=10000, random_seed=0):
+    """Replaces the questions and categories with the 6 usual categories and `num_questions` generated questions."""
+    rng = random.Random(random_seed)
+    db.drop_all()
+    db.create_all()
+    setup_search()
+    db.session.execute(Category.__table__.insert(), [{'id': i, 'type': type} for i, type in enumerate(CATEGORIES, 1)])
+    for start in range(1, num_questions + 1, chunk_size):
+        db.session.execute(Question.__table__.insert(), [{
+            'id': i,
+            'question': f'Which {rng.choice(WORDS)} is known for the {rng.choice(WORDS)} of {rng.choice(WORDS)} {i}?',
+            'answer': f'The {rng.choice(WORDS)} {rng.choice(WORDS)}',
+            'category': rng.randint(1, len(CATEGORIES)),
+            'difficulty': rng.randint(1, 5),
+        } for i in range(start, min(start + chunk_size, num_questions + 1))])
+    db.session.commit()
+    forget_cached_questions()
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute('ANALYZE questions')
+        db.session.commit()
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def _time_requests(label, request, num_requests):
+    latencies = []
+    for _ in range(num_requests):
+        begin = time.perf_counter()
+        response = request()
+        latencies.append(time.perf_counter() - begin)
+        assert response.status_code == 200, (label, response.status_code)
+    print(f'    {label:>24}: p50 {_percentile(latencies, 0.5) * 1000:8.2f} ms, '
+          f'p99 {_percentile(latencies, 0.99) * 1000:8.2f} ms')
+
+
+def benchmark_pagination(scales=(1000, 10000, 100000, 1000000), num_requests=200):
+    """Latency of the first, middle and last pages of GET /questions, by page number and by `after_id`."""
+    client = app.test_client()
+    print(f'GET /questions, {num_requests} requests per page')
+    for num_questions in scales:
+        seed_questions(num_questions)
+        print(f'  {num_questions} questions')
+        middle = num_questions // 2
+        last = num_questions - 10
+        _time_requests('page=1', lambda: client.get('/questions?page=1'), num_requests)
+        _time_requests('after_id (middle)', lambda: client.get(f'/questions?after_id={middle}'), num_requests)
+        _time_requests('after_id (last)', lambda: client.get(f'/questions?after_id={last}'), num_requests)
+        _time_requests('page (last)', lambda: client.get(f'/questions?page={num_questions // 10}'), num_requests)
+
+
+def benchmark_quiz(num_questions=100000, seen_counts=(0, 100, 1000, 10000), num_requests=200):
+    """Latency of POST /quizzes for one category and for all of them, as the player has seen more questions."""
+    client = app.test_client()
+    seed_questions(num_questions)
+    print(f'POST /quizzes, {num_questions} questions, {num_requests} requests per quiz')
+    for seen_count in seen_counts:
+        print(f'  {seen_count} previous questions')
+        for label, category_id in [('one category', 1), ('all categories', 0)]:
+            query = db.session.query(Question.id)
+            if category_id:
+                query = query.filter(Question.category == category_id)
+            previous_questions = [id for id, in query.limit(seen_count)]
+            data = {'previous_questions': previous_questions, 'quiz_category': {'type': label, 'id': category_id}}
+            _time_requests(label, lambda: client.post('/quizzes', json=data), num_requests)
+
+
+def benchmark_search(scales=(10000, 100000, 1000000), num_requests=100):
+    """Latency of searching for a rare and a common term, alone and within a category, by POST /questions."""
+    client = app.test_client()
+    print(f'POST /questions searchTerm, {num_requests} requests per search')
+    for num_questions in scales:
+        seed_questions(num_questions)
+        print(f'  {num_questions} questions')
+        rare_term = f'{WORDS[0]} {num_questions // 2}'
+        searches = [
+            ('rare term', {'searchTerm': rare_term}),
+            ('common term', {'searchTerm': WORDS[1]}),
+            ('common term, page 50', {'searchTerm': WORDS[1], 'page': 50}),
+            ('common term, category', {'searchTerm': WORDS[1], 'category': 2}),
+        ]
+        for label, data in searches:
+            _time_requests(label, lambda: client.post('/questions', json=data), num_requests)
+
+
+def benchmark_ingest(num_questions=100000, chunk_sizes=(100, 1000, 10000)):
+    """Throughput of ingest_questions over JSON lines, by chunk size."""
+    rng = random.Random(0)
+    lines = [json.dumps({
+        'question': f'Which {rng.choice(WORDS)} is known for the {rng.choice(WORDS)} of {rng.choice(WORDS)} {i}?',
+        'answer': f'The {rng.choice(WORDS)} {rng.choice(WORDS)}',
+        'category': rng.randint(1, len(CATEGORIES)),
+        'difficulty': rng.randint(1, 5),
+    }) for i in range(num_questions)]
+    print(f'ingest_questions, {num_questions} questions as JSON lines')
+    for chunk_size in chunk_sizes:
+        seed_questions(0)
+        report = ingest_questions(lines, 'jsonl', chunk_size)
+        assert report.inserted == num_questions, report.errors
+        print(f'    chunks of {chunk_size:>6}: {report.seconds:6.2f} s, {report.questions_per_second:8.0f} questions/s')
+
+
+if __name__ == '__main__':
+    benchmark_pagination()
+    benchmark_quiz()
+    benchmark_search()
+    benchmark_ingest()
@@ -1,19 +1,26 @@
 import json
 import os
+import click
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 
-from backend.models import setup_db, Question, Category
+from backend.models import (setup_db, category_cache, count_questions, database_path, random_unseen_question,
+                            Question)
+from backend.ingest import CHUNK_SIZE, CONTENT_TYPES, FORMATS, MAX_CHUNK_SIZE, format_for, ingest_questions
+from backend.search import search_questions
 
 QUESTIONS_PER_PAGE = 10
+# Seconds for which clients may reuse the categories without asking again.
+CATEGORIES_MAX_AGE = 300
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    if test_config:
+        app.config.from_mapping(test_config)
+    setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
     CORS(app)  # CORS by default allows '*' for all origins.
 
     @app.errorhandler(400)
@@ -65,30 +72,44 @@ def create_app(test_config=None):
     @app.route('/categories')
     def get_categories():
         try:
-            categories = Category.query.order_by(Category.id).all()
-            return jsonify({
+            response = jsonify({
                 'success': True,
-                'categories': {category.id: category.type for category in categories}
+                'categories': category_cache.types()
             })
         except:
             abort(500)
+        response.set_etag(category_cache.version)
+        response.cache_control.public = True
+        response.cache_control.max_age = CATEGORIES_MAX_AGE
+        return response.make_conditional(request)
 
     @app.route('/questions')
     def get_questions():
+        """A page of questions by id. `page` counts pages from the first one; `after_id`, the `next_after_id` of the
+        previous page, reads the next page straight from the primary key index however deep it is."""
         try:
             page = request.args.get('page', 1, type=int)
-            questions = Question.query.order_by(Question.id).all()
-            start = (page - 1) * QUESTIONS_PER_PAGE
-            end = start + QUESTIONS_PER_PAGE
-            questions_list = [question.format() for question in questions][start:end]
-            if not questions_list:
+            # Not type=int, which would read an invalid after_id as none and answer with the first page.
+            after_id = request.args.get('after_id')
+            query = Question.query.order_by(Question.id)
+            if after_id is not None:
+                query = query.filter(Question.id > int(after_id))
+            elif page >= 1:
+                query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+            else:
+                abort(400)
+            # One more row than the page tells whether there is a next one.
+            questions = query.limit(QUESTIONS_PER_PAGE + 1).all()
+            if not questions:
                 abort(400)
-            categories = {category.id: category.type for category in Category.query.order_by(Category.id).all()}
+            has_next_page = len(questions) > QUESTIONS_PER_PAGE
+            questions = questions[:QUESTIONS_PER_PAGE]
             return jsonify({
                 'success': True,
-                'questions': questions_list,
-                'total_questions': len(questions),
-                'categories': categories,
+                'questions': [question.format() for question in questions],
+                'total_questions': count_questions(),
+                'next_after_id': questions[-1].id if has_next_page else None,
+                'categories': category_cache.types(),
                 'current_category': "Science"
                 # Since the front end doesn't tell us what category it's on in this request,
             })  # we default to Science.
@@ -124,39 +145,86 @@ def create_app(test_config=None):
                 })
             elif 'searchTerm' in data.keys():
                 search_term = data['searchTerm']
-                questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
+                page = int(data.get('page', 1))
+                category_id = data.get('category')
+                category_id = int(category_id) if category_id else None
+                if page < 1 or (category_id is not None and category_id not in category_cache.types()):
+                    abort(422)
+                questions, total_questions = search_questions(search_term, category_id, page, QUESTIONS_PER_PAGE)
                 return jsonify({
                     'success': True,
-                    'questions': [question.format() for question in questions]
+                    'questions': [question.format() for question in questions],
+                    'total_questions': total_questions,
+                    'current_category': category_cache.types()[category_id] if category_id else None
                 })
         except:
             abort(422)
 
-    @app.route('/categories/<category_id>/questions')
+    @app.route('/questions/batch', methods=['POST'])
+    def create_questions():
+        """Adds the questions of the request body, in the format given by `format` or by the Content-Type, in
+        transactions of `chunk_size` questions, from 1 to MAX_CHUNK_SIZE."""
+        format = request.args.get('format') or CONTENT_TYPES.get(request.mimetype, 'jsonl')
+        if format not in FORMATS:
+            abort(400)
+        chunk_size = min(max(request.args.get('chunk_size', CHUNK_SIZE, type=int), 1), MAX_CHUNK_SIZE)
+        lines = (line.decode('utf-8') for line in request.stream)
+        try:
+            report = ingest_questions(lines, format, chunk_size)
+        except UnicodeDecodeError:
+            # The chunks before the line that is not UTF-8 are already added.
+            abort(400)
+        return jsonify({
+            'success': True,
+            **report.format()
+        })
+
+    @app.cli.command('ingest-questions')
+    @click.argument('source', type=click.File(encoding='utf-8'))
+    @click.option('--format', type=click.Choice(FORMATS), help='Defaults to the format given by the file extension.')
+    @click.option('--chunk-size', default=CHUNK_SIZE, type=click.IntRange(1, MAX_CHUNK_SIZE), show_default=True,
+                  help='Questions added per transaction.')
+    def ingest_questions_command(source, format, chunk_size):
+        """Adds the questions of SOURCE, a JSON lines, CSV or pg_dump file, or - for standard input."""
+        name = getattr(source, 'name', '-')
+        try:
+            format = format or format_for(name)
+        except ValueError as error:
+            raise click.UsageError(str(error))
+        report = ingest_questions(source, format, chunk_size)
+        for line_number, message in report.errors:
+            click.echo(f'{name}:{line_number}: {message}', err=True)
+        click.echo(f'Added {report.inserted} questions in {report.seconds:.2f} s '
+                   f'({report.questions_per_second:.0f} questions/s), rejected {report.rejected}.')
+
+    @app.route('/categories/<int:category_id>/questions')
     def get_questions_by_category(category_id):
-        category = Category.query.filter(Category.id == category_id).one_or_none()
-        if not category:
+        category_type = category_cache.types().get(category_id)
+        if category_type is None:
             abort(404)
 
-        questions = Question.query.filter(Question.category == category.id).all()
+        questions = Question.query.filter(Question.category == category_id).all()
         return jsonify({
             'success': True,
             'total_questions': len(questions),
-            'current_category': category.type,
+            'current_category': category_type,
             'questions': [question.format() for question in questions]
         })
 
     @app.route('/quizzes', methods=['POST'])
     def create_quiz():
-        data = json.loads(request.data)
-        previous_questions = data['previous_questions']  # will have ids of questions
-        quiz_category_id = data['quiz_category']['id']
-        questions = Question.query.filter(Question.category == quiz_category_id).all()
-        unseen_questions = [question.format() for question in questions if question.id not in previous_questions]
-        print('unseen questions are: ', unseen_questions)
+        """A random question the player has not seen yet, from the quiz category or from any category when its id
+        is 0; False once there is none left."""
+        try:
+            data = json.loads(request.data)
+            previous_questions = [int(id) for id in data['previous_questions']]  # will have ids of questions
+            quiz_category_id = int(data['quiz_category']['id'])
+        except (KeyError, TypeError, ValueError):
+            abort(400)
+        question = random_unseen_question(quiz_category_id or None, previous_questions)
         return jsonify({
             'success': True,
-            'question': random.choice(unseen_questions) if unseen_questions else False
+            'question': question.format() if question else False
         })
 
     return app
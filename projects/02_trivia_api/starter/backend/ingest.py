@@ -0,0 +1,196 @@
+"""Bulk loading of questions from JSON lines, CSV or a pg_dump file such as trivia.psql.
+
+Every record needs a question, an answer, a difficulty from 1 to 5 and the id of an existing category; ids in the input
+are ignored, the questions are added as new ones. Records are read as a stream and inserted in chunks of `chunk_size`,
+one transaction per chunk: a chunk whose insert fails is rolled back and reported, without undoing the chunks before
+it. Invalid records are skipped and reported with their line number.
+"""
+import csv
+import json
+import time
+from collections import defaultdict, namedtuple
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from backend.models import db, category_cache, forget_cached_questions, Question
+
+FORMATS = ('jsonl', 'csv', 'psql')
+CONTENT_TYPES = {'application/x-ndjson': 'jsonl', 'application/jsonl': 'jsonl', 'text/csv': 'csv'}
+CHUNK_SIZE = 1000
+MAX_CHUNK_SIZE = 10000
+MAX_REPORTED_ERRORS = 100
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 5
+
+
+class IngestReport(namedtuple('IngestReport', ['inserted', 'rejected', 'errors', 'seconds'])):
+    """The numbers of questions added and rejected, the first (line number, message) errors, and the time taken."""
+
+    @property
+    def questions_per_second(self):
+        return self.inserted / self.seconds if self.seconds else 0.0
+
+    def format(self):
+        return {
+            'inserted': self.inserted,
+            'rejected': self.rejected,
+            'errors': [{'line': line_number, 'message': message} for line_number, message in self.errors],
+            'seconds': round(self.seconds, 3),
+            'questions_per_second': round(self.questions_per_second, 1)
+        }
+
+
+_PSQL_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v', '\\': '\\'}
+
+
+def format_for(filename):
+    """The format of a file, from its extension."""
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension in ('psql', 'sql'):
+        return 'psql'
+    if extension == 'csv':
+        return 'csv'
+    raise ValueError(f'Unknown format of {filename}; expected one of {", ".join(FORMATS)}')
+
+
+def read_jsonl(lines):
+    for line_number, line in enumerate(lines, 1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as error:
+                yield line_number, ValueError(f'invalid JSON: {error}')
+
+
+def read_csv(lines):
+    """Records of a CSV file with a header line naming the fields."""
+    reader = csv.DictReader(lines)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def _unescape_copy_field(field):
+    if field == '\\N':
+        return None
+    if '\\' not in field:
+        return field
+    characters = []
+    escaped = False
+    for character in field:
+        if escaped:
+            characters.append(_PSQL_ESCAPES.get(character, character))
+            escaped = False
+        elif character == '\\':
+            escaped = True
+        else:
+            characters.append(character)
+    return ''.join(characters)
+
+
+def read_psql(lines):
+    """Records of the COPY block of the questions table in a pg_dump file."""
+    columns = None
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if columns is None:
+            if line.startswith(('COPY public.questions ', 'COPY questions ')) and line.endswith('FROM stdin;'):
+                columns = [column.strip() for column in line[line.index('(') + 1:line.index(')')].split(',')]
+        elif line == '\\.':
+            return
+        else:
+            yield line_number, dict(zip(columns, map(_unescape_copy_field, line.split('\t'))))
+
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv, 'psql': read_psql}
+
+
+def _text_column(values):
+    return [value.strip() if isinstance(value, str) and value.strip() else None for value in values]
+
+
+def _integer_column(values):
+    """Integers, and the strings of CSV and pg_dump files holding one; anything else, such as 1.7 or true, which int()
+    would truncate, is None."""
+    integers = []
+    for value in values:
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            integers.append(None)
+            continue
+        try:
+            integers.append(int(value))
+        except ValueError:
+            integers.append(None)
+    return integers
+
+
+def validate(chunk, category_ids):
+    """The rows to insert for a chunk of (line number, record) pairs, and the errors of the invalid records.
+
+    Each field is converted and checked for the whole chunk at once, then the records with an invalid field are
+    set aside.
+    """
+    line_numbers = [line_number for line_number, _ in chunk]
+    errors = defaultdict(list)
+    for line_number, record in chunk:
+        if isinstance(record, Exception):
+            errors[line_number].append(str(record))
+        elif not isinstance(record, dict):
+            errors[line_number].append('record must be an object')
+    unreadable = set(errors)
+    records = [record if isinstance(record, dict) else {} for _, record in chunk]
+    questions = _text_column([record.get('question') for record in records])
+    answers = _text_column([record.get('answer') for record in records])
+    difficulties = _integer_column([record.get('difficulty') for record in records])
+    categories = _integer_column([record.get('category') for record in records])
+    checks = [
+        ('question is missing', [question is not None for question in questions]),
+        ('answer is missing', [answer is not None for answer in answers]),
+        (f'difficulty must be an integer from {MIN_DIFFICULTY} to {MAX_DIFFICULTY}',
+         [difficulty is not None and MIN_DIFFICULTY <= difficulty <= MAX_DIFFICULTY for difficulty in difficulties]),
+        ('category must be the id of a category', [category in category_ids for category in categories]),
+    ]
+    for message, valid in checks:
+        for line_number, is_valid in zip(line_numbers, valid):
+            if not is_valid and line_number not in unreadable:
+                errors[line_number].append(message)
+    rows = [{'question': question, 'answer': answer, 'difficulty': difficulty, 'category': category}
+            for line_number, question, answer, difficulty, category
+            in zip(line_numbers, questions, answers, difficulties, categories) if line_number not in errors]
+    return rows, [(line_number, '; '.join(messages)) for line_number, messages in sorted(errors.items())]
+
+
+def _chunks(records, chunk_size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest_questions(lines, format='jsonl', chunk_size=CHUNK_SIZE):
+    """Adds the questions read from `lines`, an iterable of lines in `format`, and returns an IngestReport."""
+    start = time.perf_counter()
+    category_ids = set(category_cache.types())
+    inserted = rejected = 0
+    errors = []
+    for chunk in _chunks(READERS[format](lines), chunk_size):
+        rows, chunk_errors = validate(chunk, category_ids)
+        if rows:
+            try:
+                db.session.execute(Question.__table__.insert(), rows)
+                db.session.commit()
+                inserted += len(rows)
+            except SQLAlchemyError as error:
+                db.session.rollback()
+                chunk_errors.append((chunk[0][0], f'{len(rows)} questions from this line on were not added: {error}'))
+                rejected += len(rows)
+        rejected += len(chunk) - len(rows)
+        errors.extend(chunk_errors[:MAX_REPORTED_ERRORS - len(errors)])
+    if inserted:
+        forget_cached_questions()
+    return IngestReport(inserted, rejected, errors, time.perf_counter() - start)
@@ -1,11 +1,27 @@
+import hashlib
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import random
+import time
+from array import array
+from sqlalchemy import Column, String, Integer, create_engine, event, func, text
 from flask_sqlalchemy import SQLAlchemy
 import json
 
 database_name = "trivia"
 database_path = "postgres://{}/{}".format('localhost:5432', database_name)
 
+# Above this many rows, Postgres' own estimate of the table size stands in for an exact count, which reads every row.
+EXACT_COUNT_LIMIT = 100000
+# Seconds for which a count is reused. Inserts and deletes made by this process drop it right away.
+QUESTION_COUNT_TTL = 10
+# Seconds for which the categories are reused. Changes made by this process drop them right away.
+CATEGORY_CACHE_TTL = 300
+# Seconds for which the ids of the questions of a category are reused. Changes made by this process drop them.
+QUESTION_IDS_TTL = 60
+# Random picks among the ids of a category before falling back to listing the unseen ones.
+RANDOM_PICK_ATTEMPTS = 8
+_question_count = {}
+
 db = SQLAlchemy()
 
 
@@ -15,6 +31,8 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
+    from backend.search import setup_search  # search imports this module
+    setup_search()
 
 
 class Question(db.Model):
@@ -35,13 +53,16 @@ class Question(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        forget_cached_questions()
 
     def update(self):
         db.session.commit()
+        forget_cached_questions()
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        forget_cached_questions()
 
     def format(self):
         return {
@@ -53,6 +74,82 @@ class Question(db.Model):
         }
 
 
+def forget_cached_questions():
+    """Drops the count and ids of questions, after this process changed the questions."""
+    _question_count.clear()
+    question_ids.invalidate()
+
+
+def count_questions():
+    """The number of questions, counted at most every QUESTION_COUNT_TTL seconds: exactly for small tables, from
+    Postgres' estimate as of the last ANALYZE for large ones."""
+    if _question_count.get('expires', 0) > time.monotonic():
+        return _question_count['value']
+    count = None
+    if db.engine.dialect.name == 'postgresql':
+        estimate = db.session.execute(text("SELECT reltuples FROM pg_class WHERE oid = 'questions'::regclass")) \
+            .scalar()
+        if estimate is not None and estimate > EXACT_COUNT_LIMIT:
+            count = int(estimate)
+    if count is None:
+        count = db.session.query(func.count(Question.id)).scalar()
+    _question_count.update(value=count, expires=time.monotonic() + QUESTION_COUNT_TTL)
+    return count
+
+
+class QuestionIds:
+    """The ids of the questions of each category, and of all questions under the category None, read from the
+    database at most every `ttl` seconds."""
+
+    def __init__(self, ttl=QUESTION_IDS_TTL):
+        self.ttl = ttl
+        self._ids = {}
+
+    def get(self, category_id=None):
+        ids, expires = self._ids.get(category_id, (None, 0))
+        if expires <= time.monotonic():
+            query = db.session.query(Question.id)
+            if category_id is not None:
+                query = query.filter(Question.category == category_id)
+            ids = array('q', (id for id, in query))
+            self._ids[category_id] = ids, time.monotonic() + self.ttl
+        return ids
+
+    def invalidate(self):
+        self._ids = {}
+
+
+question_ids = QuestionIds()
+
+
+def random_unseen_question(category_id=None, seen_ids=()):
+    """A random question of the category, or of any category when None, whose id is not in `seen_ids`; None when
+    every question was seen.
+
+    Random ids of the category are tried until one was not seen, so only the question picked is read from the
+    database. Once most of the category was seen, the ids not seen are listed instead.
+    """
+    ids = question_ids.get(category_id)
+    seen_ids = set(seen_ids)
+    if not ids:
+        return None
+    for _ in range(RANDOM_PICK_ATTEMPTS):
+        id = random.choice(ids)
+        if id not in seen_ids:
+            break
+    else:
+        unseen_ids = [id for id in ids if id not in seen_ids]
+        if not unseen_ids:
+            return None
+        id = random.choice(unseen_ids)
+    question = Question.query.get(id)
+    if question is None:
+        # Deleted by another process since the ids were read.
+        question_ids.invalidate()
+        return random_unseen_question(category_id, seen_ids)
+    return question
+
+
 class Category(db.Model):
     __tablename__ = 'categories'
 
@@ -67,3 +164,46 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
         }
+
+
+class CategoryCache:
+    """The `{id: type}` map of every category, read from the database at most every `ttl` seconds.
+
+    `version` is a hash of the map, so it changes exactly when the map does, in every process alike.
+    """
+
+    def __init__(self, ttl=CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self._types = None
+        self._version = None
+        self._expires = 0
+
+    def _refresh(self):
+        if self._types is None or self._expires <= time.monotonic():
+            types = {category.id: category.type for category in Category.query.order_by(Category.id)}
+            self._version = hashlib.sha1(repr(sorted(types.items())).encode()).hexdigest()
+            self._types = types
+            self._expires = time.monotonic() + self.ttl
+
+    def types(self):
+        """The map of categories. Callers must not change it."""
+        self._refresh()
+        return self._types
+
+    @property
+    def version(self):
+        self._refresh()
+        return self._version
+
+    def invalidate(self):
+        self._types = None
+
+
+category_cache = CategoryCache()
+
+
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def _invalidate_categories(mapper, connection, category):
+    category_cache.invalidate()
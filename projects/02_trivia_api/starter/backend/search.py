@@ -0,0 +1,86 @@
+"""Indexed search over the text and answer of the questions.
+
+On Postgres, questions match when their words match the search terms, through a GIN full-text index, or when they
+contain the search term, through a GIN trigram index; word matches rank first, by ts_rank_cd. On SQLite, used by the
+benchmarks, an FTS5 table with the trigram tokenizer, kept up to date by triggers, finds the questions containing the
+term and ranks them by bm25.
+"""
+from sqlalchemy import column, func, literal_column, table, text
+
+from backend.models import db, Question
+
+SEARCH_CONFIG = "'english'"
+SEARCH_TEXT = "(coalesce(question, '') || ' ' || coalesce(answer, ''))"
+# Postgres only uses the indexes for expressions written exactly like theirs.
+SEARCH_DOCUMENT = f"to_tsvector({SEARCH_CONFIG}, {SEARCH_TEXT})"
+
+POSTGRES_INDEXES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f'CREATE INDEX IF NOT EXISTS ix_questions_search_document ON questions USING gin (({SEARCH_DOCUMENT}))',
+    f'CREATE INDEX IF NOT EXISTS ix_questions_search_text ON questions USING gin ({SEARCH_TEXT} gin_trgm_ops)',
+]
+SQLITE_INDEX = [
+    'DROP TABLE IF EXISTS questions_fts',
+    "CREATE VIRTUAL TABLE questions_fts USING fts5(question, answer, content='questions', content_rowid='id', "
+    "tokenize='trigram')",
+    'CREATE TRIGGER questions_fts_insert AFTER INSERT ON questions BEGIN '
+    'INSERT INTO questions_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer); END',
+    'CREATE TRIGGER questions_fts_delete AFTER DELETE ON questions BEGIN '
+    "INSERT INTO questions_fts (questions_fts, rowid, question, answer) "
+    "VALUES ('delete', old.id, old.question, old.answer); END",
+    'CREATE TRIGGER questions_fts_update AFTER UPDATE ON questions BEGIN '
+    "INSERT INTO questions_fts (questions_fts, rowid, question, answer) "
+    "VALUES ('delete', old.id, old.question, old.answer); "
+    'INSERT INTO questions_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer); END',
+    "INSERT INTO questions_fts (questions_fts) VALUES ('rebuild')",
+]
+# The trigram tokenizer cannot look up shorter terms.
+MIN_TRIGRAM_TERM_LENGTH = 3
+
+questions_fts = table('questions_fts', column('rowid'), column('rank'), column('questions_fts'))
+
+
+def setup_search():
+    """Creates the search indexes, unless they exist."""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        statements = POSTGRES_INDEXES
+    elif dialect == 'sqlite':
+        # The triggers go away with the questions table, leaving the index out of date: it is then rebuilt.
+        has_triggers = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'questions_fts_insert'")).scalar()
+        statements = [] if has_triggers else SQLITE_INDEX
+    else:
+        statements = []
+    for statement in statements:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+def _contains(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return literal_column(SEARCH_TEXT).ilike(f'%{escaped}%', escape='\\')
+
+
+def search_questions(term, category_id=None, page=1, per_page=10):
+    """The page `page` of the questions matching `term`, best matches first, and the number of matches."""
+    term = term.strip()
+    query = Question.query
+    order_by = []
+    if term and db.engine.dialect.name == 'postgresql':
+        search_query = func.websearch_to_tsquery(literal_column(SEARCH_CONFIG), term)
+        document = literal_column(SEARCH_DOCUMENT)
+        query = query.filter(document.op('@@')(search_query) | _contains(term))
+        order_by.append(func.ts_rank_cd(document, search_query).desc())
+    elif term and db.engine.dialect.name == 'sqlite' and len(term) >= MIN_TRIGRAM_TERM_LENGTH:
+        phrase = '"{}"'.format(term.replace('"', '""'))
+        query = query.join(questions_fts, questions_fts.c.rowid == Question.id) \
+            .filter(questions_fts.c.questions_fts.match(phrase))
+        order_by.append(questions_fts.c.rank)
+    elif term:
+        query = query.filter(_contains(term))
+    if category_id is not None:
+        query = query.filter(Question.category == category_id)
+    total = query.order_by(None).count()
+    questions = query.order_by(*order_by, Question.id).offset((page - 1) * per_page).limit(per_page).all()
+    return questions, total
@@ -41,6 +41,12 @@ class TriviaTestCase(unittest.TestCase):
             'categories': {'1': 'Science', '2': 'Art', '3': 'Geography', '4': 'History', '5': 'Entertainment',
                            '6': 'Sports'}, 'success': True})
 
+    def test_get_categories_not_modified(self):
+        result = self.client().get('/categories')
+        self.assertIn('max-age', result.headers['Cache-Control'])
+        result = self.client().get('/categories', headers={'If-None-Match': result.headers['ETag']})
+        self.assertEqual(result.status_code, 304)
+
     def test_get_categories_bad_method(self):
         result = self.client().post('/categories')
         response = json.loads(result.data)
@@ -57,6 +63,17 @@ class TriviaTestCase(unittest.TestCase):
         response = json.loads(result.data)
         self.assertEqual(len(response['questions']), 9)
 
+    def test_get_questions_after_id(self):
+        first_page = json.loads(self.client().get('/questions').data)
+        result = self.client().get(f"/questions?after_id={first_page['next_after_id']}")
+        second_page = json.loads(self.client().get('/questions?page=2').data)
+        self.assertEqual(json.loads(result.data)['questions'], second_page['questions'])
+        self.assertIsNone(second_page['next_after_id'])
+
+    def test_get_questions_bad_after_id(self):
+        result = self.client().get('/questions?after_id=abc')
+        self.assertEqual(result.status_code, 400)
+
     def test_get_questions_bad_page(self):
         result = self.client().get('/questions?page=10000')
         response = json.loads(result.data)
@@ -133,15 +150,33 @@ class TriviaTestCase(unittest.TestCase):
         }
         result = self.client().post('/questions', json=data)
         response = json.loads(result.data)
+        # The question with the word ranks before the one that only contains it.
         self.assertEqual(response, {
-            'questions': [{'answer': 'Maya Angelou', 'category': 4, 'difficulty': 2, 'id': 24,
-                           'question': "Whose autobiography is entitled 'I Know Why the Caged Bird Sings'?"},
-                          {'answer': 'Edward Scissorhands', 'category': 5, 'difficulty': 3,
+            'questions': [{'answer': 'Edward Scissorhands', 'category': 5, 'difficulty': 3,
                            'id': 27,
                            'question': 'What was the title of the 1990 fantasy directed by Tim Burton about a '
-                                       'young man with multi-bladed appendages?'}],
+                                       'young man with multi-bladed appendages?'},
+                          {'answer': 'Maya Angelou', 'category': 4, 'difficulty': 2, 'id': 24,
+                           'question': "Whose autobiography is entitled 'I Know Why the Caged Bird Sings'?"}],
+            'total_questions': 2,
+            'current_category': None,
             'success': True})
 
+    def test_search_for_questions_in_a_category(self):
+        data = {
+            'searchTerm': 'title',
+            'category': 4
+        }
+        result = self.client().post('/questions', json=data)
+        response = json.loads(result.data)
+        self.assertEqual([question['id'] for question in response['questions']], [24])
+        self.assertEqual(response['current_category'], 'History')
+
+    def test_search_for_questions_searches_answers(self):
+        result = self.client().post('/questions', json={'searchTerm': 'scissorhands'})
+        response = json.loads(result.data)
+        self.assertEqual(response['total_questions'], 1)
+
     def test_get_questions_by_category_returns_proper_questions(self):
         result = self.client().get('/categories/1/questions')
         response = json.loads(result.data)
@@ -163,6 +198,62 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(1, response['question']['category'])
         self.assertTrue(response['question']['id'] not in data['previous_questions'])
 
+    def test_create_quiz_over_all_categories(self):
+        data = {
+            'previous_questions': [],
+            'quiz_category': {'type': 'click', 'id': 0}
+        }
+        result = self.client().post('/quizzes', json=data)
+        response = json.loads(result.data)
+        self.assertTrue(response['question'])
+
+    def test_create_quiz_ends_when_every_question_was_seen(self):
+        question_ids = [question.id for question in Question.query.filter(Question.category == 1)]
+        data = {
+            'previous_questions': question_ids,
+            'quiz_category': {'id': 1}
+        }
+        result = self.client().post('/quizzes', json=data)
+        response = json.loads(result.data)
+        self.assertEqual(response, {'success': True, 'question': False})
+
+    def test_create_questions_in_batch(self):
+        lines = [
+            json.dumps({'question': 'Batch question one?', 'answer': 'One', 'difficulty': 1, 'category': 1}),
+            json.dumps({'question': 'Batch question two?', 'answer': 'Two', 'difficulty': 9, 'category': 1}),
+            json.dumps({'question': 'Batch question three?', 'answer': 'Three', 'difficulty': 3, 'category': 2}),
+        ]
+        result = self.client().post('/questions/batch', data='\n'.join(lines), content_type='application/x-ndjson')
+        response = json.loads(result.data)
+        self.assertEqual((response['inserted'], response['rejected']), (2, 1))
+        self.assertEqual(response['errors'], [{'line': 2, 'message': 'difficulty must be an integer from 1 to 5'}])
+
+        # delete the questions we just created to keep database the same
+        for question in Question.query.filter(Question.question.like('Batch question %')):
+            question.delete()
+
+    def test_create_questions_in_batch_rejects_floats_and_booleans(self):
+        lines = [
+            json.dumps({'question': 'Batch question one?', 'answer': 'One', 'difficulty': 1.7, 'category': 1}),
+            json.dumps({'question': 'Batch question two?', 'answer': 'Two', 'difficulty': 2, 'category': True}),
+        ]
+        result = self.client().post('/questions/batch', data='\n'.join(lines), content_type='application/x-ndjson')
+        response = json.loads(result.data)
+        self.assertEqual((response['inserted'], response['rejected']), (0, 2))
+        self.assertEqual(response['errors'], [
+            {'line': 1, 'message': 'difficulty must be an integer from 1 to 5'},
+            {'line': 2, 'message': 'category must be the id of a category'},
+        ])
+
+    def test_create_questions_in_batch_rejects_unknown_format(self):
+        result = self.client().post('/questions/batch?format=xml', data='<questions/>')
+        self.assertEqual(result.status_code, 400)
+
+    def test_create_questions_in_batch_rejects_bodies_that_are_not_utf8(self):
+        result = self.client().post('/questions/batch', data=b'{"question": "\xff"}\n',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(result.status_code, 400)
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":